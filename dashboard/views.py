@@ -1,47 +1,62 @@
 from django.contrib.auth.decorators import login_required
-from django.db.models import Avg, Count
 from django.shortcuts import render, reverse
 
-from exam.models import Submission
 from exam.utils import get_exams
+from scope.models import Scope
+from scope.tree import get_scope_tree
+from tracker.models import UserStats
+from tracker.utils import get_user_mastery
 
 
 @login_required
 def dashboard(request):
-    submissions = Submission.objects.filter(
-        user=request.user, score__isnull=False
-    ).order_by("-updated_at")
+    # the stats are rolled up when submissions are graded, see UserStats
+    stats = UserStats.objects.filter(user=request.user).first() or UserStats()
+    average_score = stats.average
+    prev_avg_score = stats.previous_average
 
-    submissions_stats = submissions.aggregate(
-        count=Count("id"), average_score=Avg("percentage")
+    # accuracy of the user in the textbooks and units they answered problems from
+    tree = get_scope_tree()
+    mastery = get_user_mastery(request.user)
+    mastery_scopes = sorted(
+        (
+            scope
+            for scope in map(tree.get, mastery)
+            if scope and scope.level <= Scope.LevelChoices.UNIT and scope.is_published
+        ),
+        key=lambda scope: scope.path,
     )
-
-    prev_avg_score = 0
-    if submissions_stats["count"] > 1:
-        prev_avg_score = submissions[1:].aggregate(
-            avg_score=Avg("percentage")
-        )["avg_score"]
+    favorites = [
+        scope
+        for scope in map(
+            tree.get, request.user.profile.favorites.values_list("id", flat=True)
+        )
+        if scope and scope.is_published
+    ]
 
     context = {
         "stats": [
             {
                 "title": "Exams Completed",
-                "count": submissions_stats["count"],
+                "count": stats.submissions_count,
                 "icon": "⏱️",
                 "url": reverse("exam-list"),
                 "trend": None,
             },
             {
                 "title": "Average Score",
-                "count": submissions_stats["average_score"],
+                "count": average_score,
                 "icon": "⭐",
                 "url": None,
-                "trend": submissions_stats["average_score"] - prev_avg_score
-                if submissions_stats["average_score"] and prev_avg_score
+                "trend": average_score - prev_avg_score
+                if average_score and prev_avg_score
                 else None,
             },
         ],
-        "favorites": request.user.profile.favorites.filter(is_published=True),
+        "favorites": favorites,
         "recent_exams": get_exams(request=request, limit=5),
+        "mastery": [
+            {"scope": scope, "percentage": mastery[scope.id]} for scope in mastery_scopes
+        ],
     }
     return render(request, "dashboard/dashboard.html", context)
@@ -1,6 +1,14 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-from .models import Answer, Exam, ExamProblem, Submission
+from .models import (
+    Answer,
+    Exam,
+    ExamLeaderboard,
+    ExamProblem,
+    ProblemStats,
+    Submission,
+)
+from .service import regrade_exam
 
 
 class ExamProblemInline(admin.TabularInline):
@@ -13,6 +21,35 @@ class ExamProblemInline(admin.TabularInline):
 class ExamAdmin(admin.ModelAdmin):
     inlines = [ExamProblemInline]
 
+    @admin.action(description="Re-grade submissions of selected exams")
+    def regrade(self, request, queryset):
+        checked = updated = 0
+        for exam in queryset:
+            exam_checked, _, exam_updated = regrade_exam(exam)
+            checked += exam_checked
+            updated += exam_updated
+        messages.success(
+            request, f"Re-graded {checked} submissions, {updated} scores changed"
+        )
 
+    actions = [regrade]
+
+
+@admin.register(ProblemStats)
+class ProblemStatsAdmin(admin.ModelAdmin):
+    list_display = ["problem", "attempts", "p_value", "discrimination"]
+    list_select_related = ["problem"]
+    readonly_fields = [
+        "problem",
+        "attempts",
+        "correct_count",
+        "choice_counts",
+        "p_value",
+        "discrimination",
+    ]
+    exclude = ["score_sum", "score_squares_sum", "correct_score_sum"]
+
+
+admin.site.register(ExamLeaderboard)
 admin.site.register(Submission)
 admin.site.register(Answer)
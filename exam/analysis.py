@@ -0,0 +1,213 @@
+import math
+from array import array
+from collections import Counter
+from itertools import compress
+
+from exam.models import Answer, Submission
+from exam.service import get_answer_key
+
+# share of the students in each of the upper and lower groups
+# of the discrimination index and the distractor analysis
+GROUP_RATIO = 0.27
+
+
+def build_response_matrix(exam, chunk_size=2000):
+    """Reads the answers of the completed submissions of an exam into a dense
+    students x items matrix, stored row by row in flat arrays:
+    `choices` has the chosen choice id of every cell (0 when unanswered)
+    and `correct` has 1 where the chosen choice is correct.
+    Submissions are walked in id chunks so memory is bounded by the matrix itself.
+    Returns (answer_key, submission_ids, choices, correct)."""
+    answer_key = get_answer_key(exam)
+    columns = {
+        problem_id: column for column, (_, problem_id, *_) in enumerate(answer_key)
+    }
+    correct_choice_ids = {
+        choice_id for _, _, correct_ids, _ in answer_key for choice_id in correct_ids
+    }
+    items_count = len(answer_key)
+
+    submission_ids = array("I")
+    choices = array("I")
+    correct = bytearray()
+    submissions = (
+        Submission.objects.filter(exam=exam, status=Submission.Status.COMPLETED)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    last_id = 0
+    while chunk := list(submissions.filter(id__gt=last_id)[:chunk_size]):
+        last_id = chunk[-1]
+        offset = len(submission_ids)
+        rows = {submission_id: offset + row for row, submission_id in enumerate(chunk)}
+        submission_ids.extend(chunk)
+        choices.frombytes(bytes(choices.itemsize * items_count * len(chunk)))
+        correct.extend(bytes(items_count * len(chunk)))
+
+        answers = Answer.objects.filter(
+            submission_id__in=chunk, choice__isnull=False
+        ).values_list("submission_id", "problem_id", "choice_id")
+        for submission_id, problem_id, choice_id in answers.iterator(
+            chunk_size=chunk_size
+        ):
+            column = columns.get(problem_id)
+            if column is None:
+                continue  # the problem was removed from the exam
+            cell = rows[submission_id] * items_count + column
+            choices[cell] = choice_id
+            correct[cell] = choice_id in correct_choice_ids
+
+    return answer_key, submission_ids, choices, correct
+
+
+def analyze_responses(answer_key, choices, correct):
+    """Computes the exam reliability and the item statistics of a response matrix.
+
+    Every statistic is computed column by column over the flat arrays with slices,
+    sum, Counter and itertools.compress, which all run in C, so the Python loops
+    are over the items and the choices only, never over the students.
+    """
+    items_count = len(answer_key)
+    students_count = len(correct) // items_count if items_count else 0
+    if not students_count:
+        return {"students_count": 0, "items_count": items_count, "items": []}
+
+    totals = [
+        sum(correct[row : row + items_count])
+        for row in range(0, len(correct), items_count)
+    ]
+    mean = sum(totals) / students_count
+    variance = sum(total * total for total in totals) / students_count - mean**2
+
+    # the upper and lower groups of students by total score
+    group_size = max(1, round(students_count * GROUP_RATIO))
+    ranking = sorted(range(students_count), key=totals.__getitem__)
+    lower = bytearray(students_count)
+    upper = bytearray(students_count)
+    for row in ranking[:group_size]:
+        lower[row] = 1
+    for row in ranking[-group_size:]:
+        upper[row] = 1
+
+    items = []
+    pq_sum = 0.0
+    for column, (order, problem_id, correct_ids, choice_ids) in enumerate(answer_key):
+        item_correct = correct[column::items_count]
+        item_choices = choices[column::items_count]
+        correct_count = sum(item_correct)
+        p = correct_count / students_count
+        pq = p * (1 - p)
+        pq_sum += pq
+
+        # point-biserial correlation between the item and the rest of the exam,
+        # so that the item does not inflate its own discrimination
+        item_total_covariance = (
+            sum(compress(totals, item_correct)) / students_count - p * mean
+        )
+        rest_variance = variance + pq - 2 * item_total_covariance
+        discrimination = (
+            (item_total_covariance - pq) / math.sqrt(pq * rest_variance)
+            if pq > 0 and rest_variance > 0
+            else None
+        )
+
+        counts = Counter(item_choices)
+        upper_counts = Counter(compress(item_choices, upper))
+        lower_counts = Counter(compress(item_choices, lower))
+        distractors = [
+            {
+                "id": choice_id,
+                "is_correct": choice_id in correct_ids,
+                "count": counts[choice_id],
+                "upper": upper_counts[choice_id],
+                "lower": lower_counts[choice_id],
+            }
+            for choice_id in choice_ids
+        ]
+        items.append({
+            "order": order,
+            "problem_id": problem_id,
+            "p_value": p,
+            "discrimination": discrimination,
+            "upper_lower_index": (
+                sum(compress(item_correct, upper))
+                - sum(compress(item_correct, lower))
+            )
+            / group_size,
+            "omitted": counts[0],
+            "choices": distractors,
+        })
+
+    # KR-20, which is Cronbach's alpha for items scored 0 or 1
+    reliability = None
+    if items_count > 1 and variance > 0:
+        reliability = items_count / (items_count - 1) * (1 - pq_sum / variance)
+    return {
+        "students_count": students_count,
+        "items_count": items_count,
+        "mean": mean,
+        "standard_deviation": math.sqrt(variance),
+        "reliability": reliability,
+        "standard_error": (
+            math.sqrt(variance * (1 - reliability)) if reliability is not None else None
+        ),
+        "items": items,
+    }
+
+
+def analyze_exam(exam, chunk_size=2000):
+    """Returns the reliability and item analysis of the completed submissions of an exam"""
+    answer_key, _, choices, correct = build_response_matrix(exam, chunk_size)
+    return analyze_responses(answer_key, choices, correct)
+
+
+def naive_analysis(answer_key, choices, correct):
+    """Reference analysis computed student by student and cell by cell,
+    used to check and benchmark analyze_responses."""
+    items_count = len(answer_key)
+    students = [
+        [
+            (choices[row + column], correct[row + column])
+            for column in range(items_count)
+        ]
+        for row in range(0, len(correct), items_count)
+    ]
+    totals = []
+    counts = [{} for _ in range(items_count)]
+    for student in students:
+        total = 0
+        for column, (choice_id, value) in enumerate(student):
+            total += value
+            counts[column][choice_id] = counts[column].get(choice_id, 0) + 1
+        totals.append(total)
+    mean = sum(totals) / len(totals)
+    variance = sum((total - mean) ** 2 for total in totals) / len(totals)
+
+    p_values = []
+    discriminations = []
+    for column in range(items_count):
+        item = [student[column][1] for student in students]
+        rest = [total - value for total, value in zip(totals, item)]
+        p = sum(item) / len(item)
+        rest_mean = sum(rest) / len(rest)
+        covariance = sum(
+            (value - p) * (score - rest_mean) for value, score in zip(item, rest)
+        ) / len(item)
+        rest_variance = sum((score - rest_mean) ** 2 for score in rest) / len(rest)
+        p_values.append(p)
+        discriminations.append(
+            covariance / math.sqrt(p * (1 - p) * rest_variance)
+            if 0 < p < 1 and rest_variance > 0
+            else None
+        )
+
+    pq_sum = sum(p * (1 - p) for p in p_values)
+    reliability = None
+    if items_count > 1 and variance > 0:
+        reliability = items_count / (items_count - 1) * (1 - pq_sum / variance)
+    return {
+        "reliability": reliability,
+        "p_values": p_values,
+        "discriminations": discriminations,
+        "choice_counts": counts,
+    }
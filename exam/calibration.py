@@ -0,0 +1,217 @@
+import math
+from array import array
+from bisect import bisect
+from itertools import accumulate
+from operator import mul, sub
+
+from exam.models import Answer, Submission
+from problem.models import Problem
+from problem.pools import invalidate_problem_pools
+
+# raw scores are kept this far from 0 and from the number of responses,
+# so that students and problems with extreme scores get finite estimates
+EXTREME_SCORE_ADJUSTMENT = 0.3
+# largest change of an estimate in one Newton step, in logits
+MAX_STEP = 1.0
+
+
+class ResponseData:
+    """Sparse 0/1 responses of students (submissions) to problems, stored as
+    compressed index arrays in both directions: the problems answered by each
+    student and the students who answered each problem.
+    Only the raw scores are kept, since they are the sufficient statistics
+    of the Rasch model, so the memory is about 8 bytes per response."""
+
+    def __init__(
+        self, problem_ids, student_ptr, student_items, item_scores, student_scores
+    ):
+        self.problem_ids = problem_ids
+        self.student_ptr = student_ptr
+        self.student_items = student_items
+        self.item_scores = item_scores
+        self.student_scores = student_scores
+
+        # the transposed index, built with a counting sort
+        counts = array("I", bytes(4 * len(problem_ids)))
+        for item in student_items:
+            counts[item] += 1
+        self.item_ptr = array("Q", [0])
+        self.item_ptr.extend(accumulate(counts))
+        self.item_students = array("I", bytes(4 * len(student_items)))
+        next_cell = array("Q", self.item_ptr[:-1])
+        for student in range(len(student_scores)):
+            for item in student_items[student_ptr[student] : student_ptr[student + 1]]:
+                self.item_students[next_cell[item]] = student
+                next_cell[item] += 1
+
+    @property
+    def responses_count(self):
+        return len(self.student_items)
+
+    def item_responses(self, item):
+        return self.item_ptr[item + 1] - self.item_ptr[item]
+
+
+def read_responses(chunk_size=5000):
+    """Streams the graded answers of all completed submissions, ordered by
+    submission, into a ResponseData. Every submission is one student."""
+    answers = (
+        Answer.objects.filter(
+            submission__status=Submission.Status.COMPLETED, choice__isnull=False
+        )
+        .order_by("submission_id")
+        .values_list("submission_id", "problem_id", "choice__is_correct")
+    )
+
+    items = {}
+    problem_ids = array("I")
+    item_scores = array("I")
+    student_ptr = array("Q", [0])
+    student_items = array("I")
+    student_scores = array("I")
+    current_submission = None
+    for submission_id, problem_id, is_correct in answers.iterator(
+        chunk_size=chunk_size
+    ):
+        if submission_id != current_submission:
+            if current_submission is not None:
+                student_ptr.append(len(student_items))
+            current_submission = submission_id
+            student_scores.append(0)
+        item = items.get(problem_id)
+        if item is None:
+            item = items[problem_id] = len(problem_ids)
+            problem_ids.append(problem_id)
+            item_scores.append(0)
+        student_items.append(item)
+        if is_correct:
+            item_scores[item] += 1
+            student_scores[-1] += 1
+    if current_submission is not None:
+        student_ptr.append(len(student_items))
+
+    return ResponseData(
+        problem_ids, student_ptr, student_items, item_scores, student_scores
+    )
+
+
+def _adjusted(score, count):
+    return min(max(score, EXTREME_SCORE_ADJUSTMENT), count - EXTREME_SCORE_ADJUSTMENT)
+
+
+def _newton_sweep(estimates, scores, ptr, indexes, other_exp, sign):
+    """Runs one Newton step on every estimate of one side of the model,
+    the student abilities (sign 1) or the problem difficulties (sign -1).
+    The probability of a correct answer is 1 / (1 + exp(b - theta)), computed as
+    1 / (1 + own * other) with `other_exp` holding exp(b) for the abilities and
+    exp(-theta) for the difficulties, so there is no exp call per response."""
+    for index, estimate in enumerate(estimates):
+        start, end = ptr[index], ptr[index + 1]
+        own = math.exp(-sign * estimate)
+        probabilities = [
+            1 / (1 + own * other)
+            for other in map(other_exp.__getitem__, indexes[start:end])
+        ]
+        expected = sum(probabilities)
+        information = expected - sum(map(mul, probabilities, probabilities))
+        if information <= 0:
+            continue
+        change = (_adjusted(scores[index], end - start) - expected) / information
+        change = max(-MAX_STEP, min(MAX_STEP, change))
+        estimates[index] += sign * change
+
+
+def _logit(score, count):
+    score = _adjusted(score, count)
+    return math.log(score / (count - score))
+
+
+def calibrate(data, max_iterations=100, tolerance=0.001, report=None):
+    """Fits the Rasch (1PL) model to the responses by joint maximum likelihood,
+    alternating Newton steps on the abilities and on the difficulties.
+    The difficulties are centered on 0 after every iteration, and at the end
+    they get the usual (L - 1) / L correction of the joint estimation bias,
+    where L is the mean number of responses per student.
+    It has converged when no centered difficulty moves by more than `tolerance`,
+    the abilities may keep shifting all together when the extreme scores
+    adjustments of the students and of the problems do not add up.
+    `report(iteration, change)` is called after every iteration.
+    Returns (difficulties, abilities, iterations, converged)."""
+    abilities = [
+        _logit(score, data.student_ptr[student + 1] - data.student_ptr[student])
+        for student, score in enumerate(data.student_scores)
+    ]
+    difficulties = [
+        -_logit(score, data.item_responses(item))
+        for item, score in enumerate(data.item_scores)
+    ]
+
+    iteration = 0
+    converged = not difficulties
+    while not converged and iteration < max_iterations:
+        iteration += 1
+        difficulties_exp = [math.exp(difficulty) for difficulty in difficulties]
+        _newton_sweep(
+            abilities,
+            data.student_scores,
+            data.student_ptr,
+            data.student_items,
+            difficulties_exp,
+            1,
+        )
+        abilities_exp = [math.exp(-ability) for ability in abilities]
+        previous = difficulties.copy()
+        _newton_sweep(
+            difficulties,
+            data.item_scores,
+            data.item_ptr,
+            data.item_students,
+            abilities_exp,
+            -1,
+        )
+        mean = sum(difficulties) / len(difficulties)
+        difficulties = [difficulty - mean for difficulty in difficulties]
+        abilities = [ability - mean for ability in abilities]
+        change = max(map(abs, map(sub, difficulties, previous)))
+        if report:
+            report(iteration, change)
+        converged = change < tolerance
+
+    if data.student_scores:
+        length = data.responses_count / len(data.student_scores)
+        if length > 1:
+            difficulties = [
+                difficulty * (length - 1) / length for difficulty in difficulties
+            ]
+    return difficulties, abilities, iteration, converged
+
+
+def difficulty_level(difficulty, thresholds):
+    """Maps a Rasch difficulty to a Problem.Difficulty, `thresholds` are the
+    sorted logits separating the consecutive levels"""
+    return Problem.Difficulty.values[bisect(thresholds, difficulty)]
+
+
+def save_difficulties(
+    data, difficulties, thresholds, min_responses=30, batch_size=1000
+):
+    """Writes the calibrated difficulties of the problems with at least
+    `min_responses` responses to Problem.irt_difficulty, and their level
+    to Problem.difficulty. Returns the number of problems updated."""
+    problems = [
+        Problem(
+            id=problem_id,
+            irt_difficulty=difficulty,
+            difficulty=difficulty_level(difficulty, thresholds),
+        )
+        for item, (problem_id, difficulty) in enumerate(
+            zip(data.problem_ids, difficulties)
+        )
+        if data.item_responses(item) >= min_responses
+    ]
+    Problem.objects.bulk_update(
+        problems, ["irt_difficulty", "difficulty"], batch_size=batch_size
+    )
+    # bulk_update does not send the signals, and the pools are split by difficulty
+    invalidate_problem_pools()
+    return len(problems)
@@ -0,0 +1,87 @@
+import csv
+import json
+
+from django.utils.dateparse import parse_date
+
+from exam.models import Answer, Submission
+
+# columns of the exported answers, and the fields they are read from
+EXPORT_FIELDS = {
+    "submission_id": "submission_id",
+    "submitted_at": "submission__updated_at",
+    "user_id": "submission__user_id",
+    "username": "submission__user__username",
+    "exam_id": "submission__exam_id",
+    "exam_title": "submission__exam__title",
+    "score": "submission__score",
+    "percentage": "submission__percentage",
+    "problem_id": "problem_id",
+    "difficulty": "problem__difficulty",
+    "lesson_id": "problem__scope_id",
+    "lesson_title": "problem__scope__title",
+    "choice_id": "choice_id",
+    "is_correct": "choice__is_correct",
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+def parse_export_date(value):
+    """returns the date of a YYYY-MM-DD filter, or None if it is empty.
+    Raises ValueError if it is not a valid date."""
+    if not value:
+        return None
+    try:
+        date = parse_date(value)
+    except ValueError:  # well formatted, but out of range
+        date = None
+    if date is None:
+        raise ValueError(f"Invalid date: {value}")
+    return date
+
+
+def export_rows(since=None, until=None, exam_ids=None, scope=None, user_ids=None):
+    """Returns the rows of the completed submissions answers, joined with their
+    submission, exam, user, problem and lesson, as a values_list queryset.
+    The optional filters are a date range, exams, a scope subtree and users."""
+    answers = Answer.objects.filter(submission__status=Submission.Status.COMPLETED)
+    if since:
+        answers = answers.filter(submission__updated_at__date__gte=since)
+    if until:
+        answers = answers.filter(submission__updated_at__date__lte=until)
+    if exam_ids:
+        answers = answers.filter(submission__exam_id__in=exam_ids)
+    if scope:
+        answers = answers.filter(scope.subtree_q("problem__scope__"))
+    if user_ids:
+        answers = answers.filter(submission__user_id__in=user_ids)
+    return answers.order_by("submission_id", "problem_id").values_list(
+        *EXPORT_FIELDS.values()
+    )
+
+
+class _Echo:
+    """A file-like object that returns what is written instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def stream_export(rows, export_format="csv", chunk_size=5000):
+    """Yields the export rows as lines of the given format, fetching them in chunks
+    (with a server-side cursor where the database supports it), so memory stays
+    constant whatever the number of rows."""
+    rows = rows.iterator(chunk_size=chunk_size)
+    if export_format == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS.keys())
+        for row in rows:
+            yield writer.writerow(row)
+    elif export_format == "jsonl":
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str) + "\n"
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
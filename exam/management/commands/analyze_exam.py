@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exam.analysis import analyze_responses, build_response_matrix, naive_analysis
+from exam.models import Exam
+
+
+class Command(BaseCommand):
+    help = "Print the reliability (KR-20) and the item analysis of an exam"
+
+    def add_arguments(self, parser):
+        parser.add_argument("exam", type=int, help="Id of the exam to analyze")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of submissions read per chunk",
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Also time a naive per-student implementation on the same answers",
+        )
+
+    def handle(self, *args, **options):
+        exam = Exam.objects.filter(id=options["exam"]).first()
+        if exam is None:
+            raise CommandError(f"Exam {options['exam']} does not exist")
+
+        start = time.perf_counter()
+        answer_key, _, choices, correct = build_response_matrix(
+            exam, options["chunk_size"]
+        )
+        loaded = time.perf_counter()
+        analysis = analyze_responses(answer_key, choices, correct)
+        analyzed = time.perf_counter()
+
+        if not analysis["students_count"]:
+            self.stdout.write(f"{exam} has no completed submissions")
+            return
+
+        self.stdout.write(
+            f"{exam}: {analysis['students_count']} students, "
+            f"{analysis['items_count']} items, "
+            f"mean {analysis['mean']:.2f}, sd {analysis['standard_deviation']:.2f}"
+        )
+        self.stdout.write(f"KR-20: {_format(analysis['reliability'])}")
+        self.stdout.write(f"SEM: {_format(analysis['standard_error'])}")
+        self.stdout.write("order  problem  p-value  r(item-rest)  D  omitted  choices")
+        for item in analysis["items"]:
+            choices_summary = " ".join(
+                f"{choice['id']}{'*' if choice['is_correct'] else ''}:"
+                f"{choice['count']}({choice['upper']}/{choice['lower']})"
+                for choice in item["choices"]
+            )
+            self.stdout.write(
+                f"{item['order']:>5}  {item['problem_id']:>7}  "
+                f"{item['p_value']:>7.2f}  {_format(item['discrimination']):>12}  "
+                f"{item['upper_lower_index']:>4.2f}  {item['omitted']:>7}  "
+                f"{choices_summary}"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Read the answers in {loaded - start:.3f}s "
+                f"and analyzed them in {analyzed - loaded:.3f}s"
+            )
+        )
+
+        if options["benchmark"]:
+            start = time.perf_counter()
+            naive = naive_analysis(answer_key, choices, correct)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"Naive implementation: {elapsed:.3f}s "
+                f"({elapsed / max(analyzed - loaded, 1e-6):.1f}x slower), "
+                f"KR-20 {_format(naive['reliability'])}"
+            )
+
+
+def _format(value):
+    return "-" if value is None else f"{value:.3f}"
@@ -0,0 +1,96 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exam.calibration import calibrate, read_responses, save_difficulties
+
+
+class Command(BaseCommand):
+    help = (
+        "Calibrate the problems difficulties with a Rasch (1PL) model fitted "
+        "over all the graded answers, and write them back to the problems"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-iterations",
+            type=int,
+            default=100,
+            help="Maximum number of Newton iterations",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.001,
+            help="Largest change of an estimate, in logits, to stop at",
+        )
+        parser.add_argument(
+            "--min-responses",
+            type=int,
+            default=30,
+            help="Problems with fewer responses keep their difficulty",
+        )
+        parser.add_argument(
+            "--thresholds",
+            default="-1,0,1",
+            help="Logits separating easy, medium, hard and extra hard problems",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Number of answers fetched per query",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Fit the model without saving the difficulties",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            thresholds = sorted(
+                float(value) for value in options["thresholds"].split(",")
+            )
+        except ValueError:
+            raise CommandError(f"Invalid thresholds: {options['thresholds']}")
+        if len(thresholds) != 3:
+            raise CommandError("There must be 3 thresholds, one between each level")
+
+        start = time.perf_counter()
+        data = read_responses(options["chunk_size"])
+        read = time.perf_counter()
+        self.stdout.write(
+            f"Read {data.responses_count} responses of {len(data.student_scores)} "
+            f"submissions to {len(data.problem_ids)} problems in {read - start:.2f}s"
+        )
+
+        def report(iteration, change):
+            self.stdout.write(f"Iteration {iteration}: largest change {change:.5f}")
+
+        difficulties, _, iterations, converged = calibrate(
+            data, options["max_iterations"], options["tolerance"], report
+        )
+        fitted = time.perf_counter()
+        if converged:
+            self.stdout.write(
+                f"Converged after {iterations} iterations in {fitted - read:.2f}s"
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Did not converge after {iterations} iterations "
+                    f"in {fitted - read:.2f}s"
+                )
+            )
+
+        if options["dry_run"]:
+            return
+        updated = save_difficulties(
+            data, difficulties, thresholds, options["min_responses"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Calibrated {updated} problems in {time.perf_counter() - start:.2f}s"
+            )
+        )
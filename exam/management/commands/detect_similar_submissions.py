@@ -0,0 +1,96 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exam.models import Exam
+from exam.similarity import (
+    find_similar_pairs,
+    naive_similar_pairs,
+    wrong_choice_sets,
+)
+
+
+class Command(BaseCommand):
+    help = "Flag the pairs of submissions of an exam sharing many wrong choices"
+
+    def add_arguments(self, parser):
+        parser.add_argument("exam", type=int, help="Id of the exam to check")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.6,
+            help="Minimum Jaccard similarity of the wrong choices of a pair",
+        )
+        parser.add_argument(
+            "--min-shared-wrong",
+            type=int,
+            default=3,
+            help="Minimum number of wrong choices shared by a pair",
+        )
+        parser.add_argument("--bands", type=int, default=16, help="Number of LSH bands")
+        parser.add_argument(
+            "--rows", type=int, default=4, help="Number of MinHash rows per band"
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Also score every pair of submissions and compare",
+        )
+
+    def handle(self, *args, **options):
+        exam = Exam.objects.filter(id=options["exam"]).first()
+        if exam is None:
+            raise CommandError(f"Exam {options['exam']} does not exist")
+
+        start = time.perf_counter()
+        submission_ids, wrong_sets, chosen_sets = wrong_choice_sets(exam)
+        loaded = time.perf_counter()
+        flagged, candidates_count, skipped = find_similar_pairs(
+            wrong_sets,
+            chosen_sets,
+            threshold=options["threshold"],
+            min_shared_wrong=options["min_shared_wrong"],
+            bands=options["bands"],
+            rows=options["rows"],
+        )
+        detected = time.perf_counter()
+
+        for result in flagged:
+            first, second = result["pair"]
+            self.stdout.write(
+                f"Submissions {submission_ids[first]} and {submission_ids[second]}: "
+                f"{result['shared_wrong']} shared wrong choices, "
+                f"similarity {result['wrong_similarity']:.2f}, "
+                f"agreement {result['agreement']:.2f}"
+            )
+        if skipped:
+            self.stdout.write(
+                self.style.WARNING(f"{skipped} oversized LSH buckets were skipped")
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Flagged {len(flagged)} pairs of {len(submission_ids)} submissions "
+                f"from {candidates_count} candidates, read in {loaded - start:.2f}s "
+                f"and detected in {detected - loaded:.2f}s"
+            )
+        )
+
+        if options["benchmark"]:
+            start = time.perf_counter()
+            expected = naive_similar_pairs(
+                wrong_sets,
+                chosen_sets,
+                threshold=options["threshold"],
+                min_shared_wrong=options["min_shared_wrong"],
+            )
+            elapsed = time.perf_counter() - start
+            found = {result["pair"] for result in flagged}
+            recall = (
+                sum(result["pair"] in found for result in expected) / len(expected)
+                if expected
+                else 1.0
+            )
+            self.stdout.write(
+                f"All pairs: {len(expected)} pairs flagged in {elapsed:.2f}s, "
+                f"LSH recall {recall:.1%}"
+            )
@@ -0,0 +1,80 @@
+import argparse
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exam.export import EXPORT_FORMATS, export_rows, parse_export_date, stream_export
+from scope.models import Scope
+
+
+def _date(value):
+    try:
+        return parse_export_date(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"{e}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Stream the answers of completed submissions as CSV or JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=EXPORT_FORMATS, default="csv", help="Output format"
+        )
+        parser.add_argument(
+            "--output", type=str, help="Path of the output file, stdout by default"
+        )
+        parser.add_argument("--since", type=_date, help="YYYY-MM-DD")
+        parser.add_argument("--until", type=_date, help="YYYY-MM-DD")
+        parser.add_argument("--exam", type=int, nargs="*", default=[])
+        parser.add_argument(
+            "--scope", type=int, help="Only the problems under this scope"
+        )
+        parser.add_argument("--user", type=int, nargs="*", default=[])
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Number of rows fetched from the database at a time",
+        )
+
+    def handle(self, *args, **options):
+        scope = None
+        if options["scope"]:
+            try:
+                scope = Scope.objects.get(id=options["scope"])
+            except Scope.DoesNotExist:
+                raise CommandError(f"Scope {options['scope']} does not exist")
+
+        rows = export_rows(
+            since=options["since"],
+            until=options["until"],
+            exam_ids=options["exam"],
+            scope=scope,
+            user_ids=options["user"],
+        )
+
+        output = (
+            open(options["output"], "w", encoding="utf-8", newline="")
+            if options["output"]
+            else sys.stdout
+        )
+        start = time.perf_counter()
+        lines = 0
+        try:
+            for line in stream_export(rows, options["format"], options["chunk_size"]):
+                output.write(line)
+                lines += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        elapsed = time.perf_counter() - start
+
+        # the report goes to stderr so it does not mix with exported rows on stdout
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Exported {lines} lines in {elapsed:.2f}s "
+                f"({lines / elapsed if elapsed else 0:.0f} lines/s)"
+            )
+        )
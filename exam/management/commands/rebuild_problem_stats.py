@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from exam.service import rebuild_problem_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the problems stats from all the graded answers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of problems stats inserted per query",
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_problem_stats(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the stats of {total} problems"))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exam.models import Exam, Submission
+from exam.service import regrade_exam
+
+
+class Command(BaseCommand):
+    help = "Re-grade completed submissions against the current answer keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--exam", type=int, nargs="*", default=[], help="Ids of exams to re-grade"
+        )
+        parser.add_argument(
+            "--problem",
+            type=int,
+            nargs="*",
+            default=[],
+            help="Re-grade every exam containing these problem ids",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of submissions graded per chunk",
+        )
+
+    def handle(self, *args, **options):
+        exams = Exam.objects.filter(
+            submissions__status=Submission.Status.COMPLETED
+        ).distinct()
+        if options["exam"]:
+            exams = exams.filter(id__in=options["exam"])
+        if options["problem"]:
+            exams = exams.filter(exam_problems__problem_id__in=options["problem"])
+
+        start = time.perf_counter()
+        checked = answers_read = updated = 0
+        for exam in exams.iterator():
+            exam_checked, exam_answers, exam_updated = regrade_exam(
+                exam, options["chunk_size"]
+            )
+            checked += exam_checked
+            answers_read += exam_answers
+            updated += exam_updated
+            self.stdout.write(
+                f"{exam}: {exam_updated} of {exam_checked} submissions changed"
+            )
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Re-graded {checked} submissions ({updated} changed) "
+                f"from {answers_read} answers in {elapsed:.2f}s "
+                f"({answers_read / elapsed if elapsed else 0:.0f} answers/s)"
+            )
+        )
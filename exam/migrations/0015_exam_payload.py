@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0014_submission_percentage_alter_submission_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='payload',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0015_exam_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='answer_key',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0016_exam_answer_key'),
+        ('problem', '0009_problem_scope_difficulty_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemStats',
+            fields=[
+                ('problem', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='problem.problem')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('correct_count', models.PositiveIntegerField(default=0)),
+                ('choice_counts', models.JSONField(default=dict)),
+                ('score_sum', models.FloatField(default=0.0)),
+                ('score_squares_sum', models.FloatField(default=0.0)),
+                ('correct_score_sum', models.FloatField(default=0.0)),
+            ],
+            options={
+                'verbose_name_plural': 'Problem stats',
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0018_submission_result'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamLeaderboard',
+            fields=[
+                ('exam', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='leaderboard', serialize=False, to='exam.exam')),
+                ('histogram', models.JSONField(default=list)),
+                ('top', models.JSONField(default=list)),
+            ],
+        ),
+    ]
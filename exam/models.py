@@ -1,3 +1,5 @@
+import math
+
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -26,6 +28,12 @@ class Exam(models.Model):
         Problem, through="ExamProblem", related_name="exams", related_query_name="exam"
     )
     is_published = models.BooleanField(default=False)
+    # frozen snapshot of the exam problems and their choices (see service.get_exam_payload)
+    # it is reset to null whenever the exam problems change
+    payload = models.JSONField(null=True, blank=True, editable=False)
+    # [order, problem id, correct choice ids, valid choice ids] of each exam problem
+    # it is derived from the payload and reset with it
+    answer_key = models.JSONField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
@@ -62,6 +70,8 @@ class Submission(models.Model):
     score = models.PositiveSmallIntegerField(default=0)
     percentage = models.FloatField(default=0.0)
     is_published = models.BooleanField(default=False)
+    # snapshot of the graded exam problems (see service.build_submission_result)
+    result = models.JSONField(null=True, blank=True, editable=False)
 
     class Status(models.TextChoices):
         EXITED_UNEXPECTEDLY = "exited_unexpectedly", "Exited Unexpectedly"
@@ -118,3 +128,108 @@ class Answer(models.Model):
                 f"Problem {self.problem.body[:16]} is not in this exam."
             )
         super().clean()
+
+
+class ProblemStats(models.Model):
+    """
+    Item statistics of a problem, updated in batch every time an exam is graded.
+    The sums of the submission percentages are kept so that the point-biserial
+    discrimination can be computed without going back to the answers.
+    """
+
+    problem = models.OneToOneField(
+        Problem, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+    choice_counts = models.JSONField(default=dict)  # {choice id: times picked}
+    score_sum = models.FloatField(default=0.0)
+    score_squares_sum = models.FloatField(default=0.0)
+    correct_score_sum = models.FloatField(default=0.0)
+
+    class Meta:
+        verbose_name_plural = "Problem stats"
+
+    def __str__(self):
+        return f"{self.problem} - {self.correct_count} / {self.attempts}"
+
+    def add_answer(self, choice_id, is_correct, percentage):
+        """Counts one answer of a submission that scored `percentage`"""
+        self.attempts += 1
+        self.correct_count += is_correct
+        self.choice_counts[str(choice_id)] = (
+            self.choice_counts.get(str(choice_id), 0) + 1
+        )
+        self.score_sum += percentage
+        self.score_squares_sum += percentage**2
+        if is_correct:
+            self.correct_score_sum += percentage
+
+    @property
+    def p_value(self):
+        """the ratio of correct answers, the higher it is the easier the problem"""
+        return self.correct_count / self.attempts if self.attempts else None
+
+    @property
+    def discrimination(self):
+        """point-biserial correlation between answering correctly and the score"""
+        correct, wrong = self.correct_count, self.attempts - self.correct_count
+        if not correct or not wrong:
+            return None
+        mean = self.score_sum / self.attempts
+        variance = self.score_squares_sum / self.attempts - mean**2
+        if variance <= 0:
+            return None
+        correct_mean = self.correct_score_sum / correct
+        wrong_mean = (self.score_sum - self.correct_score_sum) / wrong
+        return (
+            (correct_mean - wrong_mean)
+            / math.sqrt(variance)
+            * math.sqrt(correct * wrong)
+            / self.attempts
+        )
+
+
+class ExamLeaderboard(models.Model):
+    """
+    Score distribution of an exam, updated every time one of its submissions
+    is graded. The histogram has one bucket per integer percentage,
+    so ranks and percentiles are computed in constant time.
+    """
+
+    TOP_LENGTH = 10
+
+    exam = models.OneToOneField(
+        Exam, on_delete=models.CASCADE, primary_key=True, related_name="leaderboard"
+    )
+    histogram = models.JSONField(default=list)  # submissions count per percentage
+    top = models.JSONField(default=list)  # [{submission_id, username, percentage}]
+
+    def __str__(self):
+        return f"{self.exam.title} - {self.submissions_count} submissions"
+
+    @property
+    def submissions_count(self):
+        return sum(self.histogram)
+
+    def add_score(self, submission_id, username, percentage):
+        """Adds the percentage of a graded submission to the histogram and the top"""
+        if not self.histogram:
+            self.histogram = [0] * 101
+        self.histogram[round(percentage)] += 1
+        self.top.append({
+            "submission_id": submission_id,
+            "username": username,
+            "percentage": percentage,
+        })
+        self.top.sort(key=lambda entry: (-entry["percentage"], entry["submission_id"]))
+        del self.top[self.TOP_LENGTH :]
+
+    def rank(self, percentage):
+        """returns the rank of a percentage and the percent of other submissions
+        that scored lower (None if it is the only submission)"""
+        bucket = round(percentage)
+        higher = sum(self.histogram[bucket + 1 :])
+        lower = sum(self.histogram[:bucket])
+        others = self.submissions_count - 1
+        return higher + 1, round(lower / others * 100) if others else None
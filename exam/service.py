@@ -1,41 +1,609 @@
-from exam.models import Answer, Submission
+import random
 
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
 
-def correct_exam(exam_problems, submission, submitted_answers):
-    score = 0
+from exam.models import Answer, Exam, ExamLeaderboard, ProblemStats, Submission
+from problem.models import Choice, Problem
+from problem.pools import get_problem_pools
+from tracker.bitset import Bitset
+from tracker.models import LessonMastery, UserStats
+
+
+def _pool_candidates(pools):
+    """returns the set of all the problem ids in the given pools"""
+    return set().union(*(ids for pool in pools.values() for ids in pool.values()))
+
+
+def _split_quota(total, weights):
+    """splits total into integer quotas proportional to weights (largest remainder)"""
+    exact = [total * weight / sum(weights) for weight in weights]
+    quotas = [int(share) for share in exact]
+    by_remainder = sorted(
+        range(len(weights)), key=lambda i: exact[i] - quotas[i], reverse=True
+    )
+    for i in by_remainder[: total - sum(quotas)]:
+        quotas[i] += 1
+    return quotas
+
+
+def _sample_excluding(ids, size, taken, seen=()):
+    """samples up to `size` ids that are not in `taken`,
+    reading at most size + len(taken) of them.
+    The ids in `seen` are only picked when there are not enough other ones."""
+    if seen:
+        unseen = [problem_id for problem_id in ids if problem_id not in seen]
+        picked = _sample_excluding(unseen, size, taken)
+        if len(picked) < size and len(unseen) < len(ids):
+            seen_ids = [problem_id for problem_id in ids if problem_id in seen]
+            picked += _sample_excluding(seen_ids, size - len(picked), taken)
+        return picked
+    picked = random.sample(ids, min(len(ids), size + len(taken)))
+    return [problem_id for problem_id in picked if problem_id not in taken][:size]
+
+
+def sample_problem_ids(scopes, size=None, seen=()):
+    """Picks `size` distinct published problem ids from the given scopes.
+
+    The ids come from the cached per-scope pools, so the Problem table is not
+    touched, and overlapping scopes are merged through a set union.
+    The problems in `seen` (e.g. the user answered ones) are only picked
+    when there are not enough other ones.
+    If size is None, all the ids are returned shuffled.
+    Returns the sampled ids and the number of available problems.
+    """
+    candidates = list(_pool_candidates(get_problem_pools(scopes)))
+    if size is None or size > len(candidates):
+        size = len(candidates)
+    if size <= 0:
+        return [], len(candidates)
+    sample = _sample_excluding(candidates, size, (), seen)
+    random.shuffle(sample)
+    return sample, len(candidates)
+
+
+def sample_stratified_problem_ids(scopes, size, mix, seen=()):
+    """Picks `size` distinct published problem ids following a difficulty mix.
+
+    The exam is split evenly between the scopes, then each scope quota is split
+    between the difficulties by the weights in `mix` (difficulty -> weight),
+    and every quota is sampled from its own (scope, difficulty) pool.
+    Strata that run short are topped up from the rest of the candidates,
+    so a sample shorter than `size` holds every available problem.
+    In every stratum, the problems in `seen` are only picked when there are
+    not enough other ones.
+    """
+    if size <= 0:
+        return []
+    pools = get_problem_pools(scopes)
+    difficulties = list(mix)
+    scope_quotas = _split_quota(size, [1] * len(pools))
+    random.shuffle(scope_quotas)
+
+    sample = []
+    taken = set()
+    for pool, scope_quota in zip(pools.values(), scope_quotas):
+        quotas = _split_quota(scope_quota, [mix[d] for d in difficulties])
+        for difficulty, quota in zip(difficulties, quotas):
+            picked = _sample_excluding(pool[difficulty], quota, taken, seen)
+            sample.extend(picked)
+            taken.update(picked)
+
+    if len(sample) < size:
+        # some strata ran short, so fill the rest from any difficulty
+        rest = list(_pool_candidates(pools) - taken)
+        sample.extend(_sample_excluding(rest, size - len(sample), (), seen))
+
+    random.shuffle(sample)
+    return sample
+
+
+def _figure_payload(figure):
+    return {"url": figure.url, "name": figure.name} if figure else None
 
-    all_choices = {
-        choice.id: choice
+
+def build_exam_payload(exam) -> list[dict]:
+    """Builds the snapshot of the exam problems, in order, with their choices"""
+    exam_problems = exam.exam_problems.select_related("problem").prefetch_related(
+        Prefetch("problem__choices", queryset=Choice.objects.filter(is_archived=False))
+    )
+    return [
+        {
+            "order": exam_problem.order,
+            "id": exam_problem.problem.id,
+            "body": exam_problem.problem.body,
+            "figure": _figure_payload(exam_problem.problem.figure),
+            "choices": [
+                {
+                    "id": choice.id,
+                    "body": choice.body,
+                    "figure": _figure_payload(choice.figure),
+                    "is_correct": choice.is_correct,
+                }
+                for choice in exam_problem.problem.choices.all()
+            ],
+        }
         for exam_problem in exam_problems
-        for choice in exam_problem.problem.choices.all()
-    }
+    ]
+
+
+def get_exam_payload(exam) -> list[dict]:
+    """returns the frozen payload of the exam, building and storing it if needed"""
+    if exam.payload is None:
+        exam.payload = build_exam_payload(exam)
+        Exam.objects.filter(pk=exam.pk).update(payload=exam.payload)
+    return exam.payload
+
+
+def build_answer_key(payload) -> list[list]:
+    """Builds the answer key of an exam from its payload"""
+    return [
+        [
+            problem["order"],
+            problem["id"],
+            [choice["id"] for choice in problem["choices"] if choice["is_correct"]],
+            [choice["id"] for choice in problem["choices"]],
+        ]
+        for problem in payload
+    ]
+
+
+def get_answer_key(exam) -> list[list]:
+    """returns the answer key of the exam, building and storing it if needed"""
+    if exam.answer_key is None:
+        exam.answer_key = build_answer_key(get_exam_payload(exam))
+        Exam.objects.filter(pk=exam.pk).update(answer_key=exam.answer_key)
+    return exam.answer_key
+
 
+def build_submission_result(payload, chosen_choice_ids) -> list[dict]:
+    """Builds the result snapshot of a submission, the exam payload problems
+    marked with the chosen choices and whether they were answered correctly"""
+    result = []
+    for problem in payload:
+        choices = [
+            {**choice, "checked": choice["id"] in chosen_choice_ids}
+            for choice in problem["choices"]
+        ]
+        result.append({
+            "id": problem["id"],
+            "body": problem["body"],
+            "figure": problem["figure"],
+            "choices": choices,
+            "answered_correctly": any(
+                choice["checked"] and choice["is_correct"] for choice in choices
+            ),
+        })
+    return result
+
+
+def get_submission_result(submission) -> list[dict]:
+    """returns the result snapshot of a completed submission,
+    building and storing it if needed"""
+    if submission.result is None:
+        chosen_choice_ids = set(
+            submission.answers.filter(choice__isnull=False).values_list(
+                "choice_id", flat=True
+            )
+        )
+        submission.result = build_submission_result(
+            get_exam_payload(submission.exam), chosen_choice_ids
+        )
+        Submission.objects.filter(pk=submission.pk).update(result=submission.result)
+    return submission.result
+
+
+def correct_exam(exam, submission, submitted_answers):
+    """Grades the submitted answers against the exam answer key,
+    then stores the answers in one bulk insert and the score in one update.
+    The exam aggregates (problems stats and leaderboard) are updated once
+    the grading is committed.
+    The submission is claimed before anything is written, so it is graded
+    only once, and False is returned if it was already graded."""
+    answer_key = get_answer_key(exam)
+    score = 0
     answers = []
+    graded = []
 
-    for exam_problem in exam_problems:
-        choice_id = submitted_answers.get(f"problem_{exam_problem.order}")
-
-        if choice_id:
-            try:
-                choice_id = int(choice_id)
-                choice = all_choices.get(choice_id)
-                if choice is not None and choice.problem_id == exam_problem.problem.id:
-                    answers.append(
-                        Answer(
-                            submission=submission,
-                            problem=exam_problem.problem,
-                            choice=choice,
-                        )
-                    )
-                    if choice.is_correct:
-                        score += 1
-            except (ValueError, TypeError):
-                pass  # silently ignore invalid input
-
-    # Bulk insert answers
-    Answer.objects.bulk_create(answers)
+    for order, problem_id, correct_choice_ids, choice_ids in answer_key:
+        try:
+            choice_id = int(submitted_answers.get(f"problem_{order}"))
+        except (ValueError, TypeError):
+            continue  # silently ignore missing and invalid input
+        if choice_id not in choice_ids:
+            continue
+        answers.append(
+            Answer(submission=submission, problem_id=problem_id, choice_id=choice_id)
+        )
+        is_correct = choice_id in correct_choice_ids
+        graded.append((problem_id, choice_id, is_correct))
+        score += is_correct
 
     submission.score = score
-    submission.percentage = score / exam_problems.count() * 100
+    submission.percentage = score / len(answer_key) * 100 if answer_key else 0.0
     submission.status = Submission.Status.COMPLETED
-    submission.save()
+    submission.result = build_submission_result(
+        get_exam_payload(exam), {answer.choice_id for answer in answers}
+    )
+
+    with transaction.atomic():
+        # a double submit waits here for the first grading to commit,
+        # then finds the submission completed
+        claimed = (
+            Submission.objects.filter(pk=submission.pk)
+            .exclude(status=Submission.Status.COMPLETED)
+            .update(status=Submission.Status.COMPLETED)
+        )
+        if not claimed:
+            return False
+        # Bulk insert answers
+        Answer.objects.bulk_create(answers)
+        submission.save(
+            update_fields=["score", "percentage", "status", "result", "updated_at"]
+        )
+        update_user_stats(submission, [problem_id for problem_id, _, _ in graded])
+        update_lesson_mastery(submission.user_id, graded)
+        # the problems stats and the leaderboard rows are shared by everyone
+        # taking the exam, so they are locked in their own short transactions
+        # after the grading commits instead of serializing the gradings
+        transaction.on_commit(
+            lambda: update_problem_stats(graded, submission.percentage), robust=True
+        )
+        transaction.on_commit(lambda: update_exam_leaderboard(submission), robust=True)
+    return True
+
+
+def _leaderboard_cache_key(exam_id):
+    return f"exam_leaderboard:{exam_id}"
+
+
+def _cache_leaderboard(leaderboard):
+    transaction.on_commit(
+        lambda: cache.set(
+            _leaderboard_cache_key(leaderboard.exam_id),
+            {"histogram": leaderboard.histogram, "top": leaderboard.top},
+            None,
+        )
+    )
+
+
+def get_exam_leaderboard(exam_id):
+    """returns the leaderboard of the exam from the cache or the database,
+    or None if none of its submissions was graded"""
+    data = cache.get(_leaderboard_cache_key(exam_id))
+    if data is not None:
+        return ExamLeaderboard(exam_id=exam_id, **data)
+    leaderboard = ExamLeaderboard.objects.filter(exam_id=exam_id).first()
+    if leaderboard:
+        _cache_leaderboard(leaderboard)
+    return leaderboard
+
+
+def update_exam_leaderboard(submission):
+    """Adds a graded submission to its exam leaderboard"""
+    with transaction.atomic():
+        leaderboard, _ = ExamLeaderboard.objects.select_for_update().get_or_create(
+            exam_id=submission.exam_id
+        )
+        leaderboard.add_score(
+            submission.id, submission.user.username, submission.percentage
+        )
+        leaderboard.save()
+        _cache_leaderboard(leaderboard)
+
+
+def rebuild_exam_leaderboard(exam):
+    """Rebuilds the leaderboard of the exam from its completed submissions"""
+    leaderboard = ExamLeaderboard(exam=exam)
+    submissions = Submission.objects.filter(
+        exam=exam, status=Submission.Status.COMPLETED
+    ).values_list("id", "user__username", "percentage")
+    for submission_id, username, percentage in submissions.iterator():
+        leaderboard.add_score(submission_id, username, percentage)
+    with transaction.atomic():
+        ExamLeaderboard.objects.filter(exam=exam).delete()
+        if leaderboard.histogram:
+            leaderboard.save()
+            _cache_leaderboard(leaderboard)
+        else:
+            transaction.on_commit(lambda: cache.delete(_leaderboard_cache_key(exam.id)))
+
+
+def update_user_stats(submission, problem_ids=()):
+    """Adds a completed submission, and the ids of its answered problems,
+    to its user stats rollup"""
+    with transaction.atomic():
+        stats, _ = UserStats.objects.select_for_update().get_or_create(
+            user_id=submission.user_id
+        )
+        stats.add_submission(submission.percentage)
+        stats.add_seen_problems(problem_ids)
+        stats.save()
+
+
+def _save_user_stats(batch):
+    seen = {stats.user_id: Bitset() for stats in batch}
+    answers = Answer.objects.filter(
+        submission__user_id__in=seen,
+        submission__status=Submission.Status.COMPLETED,
+        choice__isnull=False,
+    ).values_list("submission__user_id", "problem_id")
+    for user_id, problem_id in answers.iterator(chunk_size=5000):
+        seen[user_id].add(problem_id)
+
+    for stats in batch:
+        stats.seen_problems = bytes(seen[stats.user_id])
+        if stats.submissions_count > 1:
+            latest = stats.last_scores[0]
+            stats.previous_average = (stats.percentage_sum - latest) / (
+                stats.submissions_count - 1
+            )
+    UserStats.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=[
+            "submissions_count",
+            "percentage_sum",
+            "previous_average",
+            "last_scores",
+            "seen_problems",
+        ],
+    )
+
+
+def rebuild_user_stats(user_ids=None, batch_size=1000):
+    """Rebuilds the users stats rollups from their completed submissions,
+    for all the users or only the given ones. Returns the number of users."""
+    # the submissions of each user come together, the most recent first
+    submissions = (
+        Submission.objects.filter(
+            status=Submission.Status.COMPLETED, user__isnull=False
+        )
+        .order_by("user_id", "-updated_at")
+        .values_list("user_id", "percentage")
+    )
+    if user_ids is not None:
+        submissions = submissions.filter(user_id__in=user_ids)
+
+    total = 0
+    batch = []
+    stats = None
+    for user_id, percentage in submissions.iterator(chunk_size=5000):
+        if stats is None or stats.user_id != user_id:
+            if len(batch) >= batch_size:
+                _save_user_stats(batch)
+                total += len(batch)
+                batch = []
+            stats = UserStats(user_id=user_id)
+            batch.append(stats)
+        stats.submissions_count += 1
+        stats.percentage_sum += percentage
+        if len(stats.last_scores) < UserStats.LAST_SCORES_LENGTH:
+            stats.last_scores.append(percentage)
+
+    _save_user_stats(batch)
+    total += len(batch)
+    return total
+
+
+def update_lesson_mastery(user_id, graded):
+    """Adds the graded answers of a submission, (problem id, choice id, is correct)
+    tuples, to the user counters of the lessons of their problems"""
+    problem_lessons = dict(
+        Problem.objects.filter(id__in=[problem_id for problem_id, _, _ in graded])
+        .order_by()
+        .values_list("id", "scope_id")
+    )
+    counts = {}
+    for problem_id, _, is_correct in graded:
+        attempted, correct = counts.get(problem_lessons[problem_id], (0, 0))
+        counts[problem_lessons[problem_id]] = (attempted + 1, correct + is_correct)
+
+    LessonMastery.objects.bulk_create(
+        [LessonMastery(user_id=user_id, scope_id=scope_id) for scope_id in counts],
+        ignore_conflicts=True,
+    )
+    with transaction.atomic():
+        rows = list(
+            LessonMastery.objects.select_for_update().filter(
+                user_id=user_id, scope_id__in=counts
+            )
+        )
+        for row in rows:
+            attempted, correct = counts[row.scope_id]
+            row.attempted += attempted
+            row.correct += correct
+        LessonMastery.objects.bulk_update(rows, ["attempted", "correct"])
+
+
+def rebuild_lesson_mastery(user_ids=None, lesson_ids=None, batch_size=1000):
+    """Rebuilds the lessons mastery counters from the graded answers of the
+    completed submissions, for all the users and lessons, or only the given ones
+    (ids or querysets of ids). The answers are counted by the database grouped
+    by (user, lesson), so memory is bounded by the number of counters.
+    Returns the number of counters written."""
+    answers = Answer.objects.filter(
+        submission__status=Submission.Status.COMPLETED,
+        submission__user__isnull=False,
+        choice__isnull=False,
+    )
+    rows = LessonMastery.objects.all()
+    if user_ids is not None:
+        answers = answers.filter(submission__user_id__in=user_ids)
+        rows = rows.filter(user_id__in=user_ids)
+    if lesson_ids is not None:
+        answers = answers.filter(problem__scope_id__in=lesson_ids)
+        rows = rows.filter(scope_id__in=lesson_ids)
+    counts = (
+        answers.order_by()
+        .values_list("submission__user_id", "problem__scope_id")
+        .annotate(
+            attempted=Count("id"),
+            correct=Count("id", filter=Q(choice__is_correct=True)),
+        )
+    )
+
+    total = 0
+    with transaction.atomic():
+        rows.delete()
+        batch = []
+        for user_id, scope_id, attempted, correct in counts.iterator():
+            batch.append(
+                LessonMastery(
+                    user_id=user_id,
+                    scope_id=scope_id,
+                    attempted=attempted,
+                    correct=correct,
+                )
+            )
+            if len(batch) >= batch_size:
+                LessonMastery.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        LessonMastery.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def update_problem_stats(graded, percentage):
+    """Adds the graded answers of one submission, (problem id, choice id, is correct)
+    tuples, to the problems stats.
+    Missing rows are inserted first so the rows can be locked and updated in batch."""
+    problem_ids = [problem_id for problem_id, _, _ in graded]
+    ProblemStats.objects.bulk_create(
+        [ProblemStats(problem_id=problem_id) for problem_id in problem_ids],
+        ignore_conflicts=True,
+    )
+    with transaction.atomic():
+        stats = ProblemStats.objects.select_for_update().in_bulk(problem_ids)
+        for problem_id, choice_id, is_correct in graded:
+            stats[problem_id].add_answer(choice_id, is_correct, percentage)
+        ProblemStats.objects.bulk_update(
+            stats.values(),
+            [
+                "attempts",
+                "correct_count",
+                "choice_counts",
+                "score_sum",
+                "score_squares_sum",
+                "correct_score_sum",
+            ],
+        )
+
+
+def rebuild_problem_stats(problem_ids=None, batch_size=1000):
+    """Rebuilds the problems stats from the graded answers of the completed
+    submissions, for all the problems or only the given ones.
+    Returns the number of problems stats written."""
+    answers = (
+        Answer.objects.filter(
+            submission__status=Submission.Status.COMPLETED, choice__isnull=False
+        )
+        .order_by("problem_id")
+        .values_list(
+            "problem_id",
+            "choice_id",
+            "choice__is_correct",
+            "submission__percentage",
+        )
+    )
+    rows = ProblemStats.objects.all()
+    if problem_ids is not None:
+        answers = answers.filter(problem_id__in=problem_ids)
+        rows = rows.filter(problem_id__in=problem_ids)
+
+    total = 0
+    with transaction.atomic():
+        rows.delete()
+
+        # answers come ordered by problem, so each stats row is complete
+        # once the next problem starts and batches can be flushed as they fill
+        batch = []
+        stats = None
+        for problem_id, choice_id, is_correct, percentage in answers.iterator(
+            chunk_size=5000
+        ):
+            if stats is None or stats.problem_id != problem_id:
+                if len(batch) >= batch_size:
+                    ProblemStats.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+                stats = ProblemStats(problem_id=problem_id)
+                batch.append(stats)
+            stats.add_answer(choice_id, is_correct, percentage)
+        ProblemStats.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def regrade_exam(exam, chunk_size=2000):
+    """Re-grades the completed submissions of an exam against a fresh answer key.
+
+    Submissions are walked in id chunks, and for each chunk only the
+    (submission id, choice id) pairs of its answers are streamed and compared
+    with the set of correct choice ids, so memory is bounded by the chunk size.
+    Only the submissions whose score or percentage changed are written, with
+    bulk_update, then the aggregates built from the grades are rebuilt: the
+    leaderboard, the exam problems stats, the stats of the users whose
+    submissions changed and the users mastery of the exam lessons.
+    Returns the number of submissions checked, answers read and submissions updated.
+    """
+    exam.payload = exam.answer_key = None
+    answer_key = get_answer_key(exam)
+    # the result snapshots show the old correct choices, so rebuild them lazily
+    Submission.objects.filter(exam=exam).update(result=None)
+    correct_choice_ids = {
+        choice_id for _, _, correct_ids, _ in answer_key for choice_id in correct_ids
+    }
+
+    checked = answers_read = updated = 0
+    submissions = (
+        Submission.objects.filter(exam=exam, status=Submission.Status.COMPLETED)
+        .order_by("id")
+        .values_list("id", "score", "percentage", "user_id")
+    )
+    changed_user_ids = set()
+    last_id = 0
+    while chunk := {
+        submission_id: grade
+        for submission_id, *grade in submissions.filter(id__gt=last_id)[:chunk_size]
+    }:
+        last_id = max(chunk)
+        scores = dict.fromkeys(chunk, 0)
+        answers = Answer.objects.filter(
+            submission_id__in=chunk, choice__isnull=False
+        ).values_list("submission_id", "choice_id")
+        for submission_id, choice_id in answers.iterator(chunk_size=chunk_size):
+            answers_read += 1
+            if choice_id in correct_choice_ids:
+                scores[submission_id] += 1
+
+        changed = []
+        for submission_id, score in scores.items():
+            percentage = score / len(answer_key) * 100 if answer_key else 0.0
+            old_score, old_percentage, user_id = chunk[submission_id]
+            # the percentage also changes with the number of problems
+            if (score, percentage) != (old_score, old_percentage):
+                changed.append(
+                    Submission(id=submission_id, score=score, percentage=percentage)
+                )
+                if user_id is not None:
+                    changed_user_ids.add(user_id)
+        Submission.objects.bulk_update(changed, ["score", "percentage"])
+        checked += len(chunk)
+        updated += len(changed)
+
+    rebuild_exam_leaderboard(exam)
+    # the correct choices may have changed for the answers of other exams too
+    rebuild_problem_stats(exam.exam_problems.values("problem_id"))
+    changed_user_ids = sorted(changed_user_ids)
+    for start in range(0, len(changed_user_ids), chunk_size):
+        rebuild_user_stats(changed_user_ids[start : start + chunk_size])
+    # and recount the exam lessons of the users who took it
+    user_ids = Submission.objects.filter(
+        exam=exam, status=Submission.Status.COMPLETED
+    ).values("user_id")
+    rebuild_lesson_mastery(user_ids, exam.exam_problems.values("problem__scope_id"))
+    return checked, answers_read, updated
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from problem.models import Choice, Problem
+
+from .models import Exam, ExamProblem
+
+
+@receiver(post_save, sender=ExamProblem)
+@receiver(post_delete, sender=ExamProblem)
+def clear_exam_payload(sender, instance, **kwargs):
+    Exam.objects.filter(pk=instance.exam_id).update(payload=None, answer_key=None)
+
+
+@receiver(post_save, sender=Problem)
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def clear_problem_exams_payload(sender, instance, **kwargs):
+    problem_id = instance.pk if sender is Problem else instance.problem_id
+    Exam.objects.filter(exam_problems__problem_id=problem_id).update(
+        payload=None, answer_key=None
+    )
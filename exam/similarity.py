@@ -0,0 +1,189 @@
+import random
+from collections import defaultdict
+from itertools import combinations
+
+from exam.analysis import build_response_matrix
+from exam.models import Submission
+
+# a Mersenne prime larger than any choice id, for the universal hash functions
+_PRIME = (1 << 61) - 1
+
+
+def wrong_choice_sets(exam, chunk_size=2000):
+    """returns the ids of the completed submissions of an exam, the sets of the
+    wrong choices they picked and the sets of all the choices they picked"""
+    answer_key, submission_ids, choices, correct = build_response_matrix(
+        exam, chunk_size
+    )
+    items_count = len(answer_key)
+    if not items_count:
+        # nothing was answered, so every submission has empty sets
+        return (
+            list(submission_ids),
+            [set() for _ in submission_ids],
+            [set() for _ in submission_ids],
+        )
+    wrong_sets = []
+    chosen_sets = []
+    for row in range(0, len(choices), items_count):
+        row_choices = choices[row : row + items_count]
+        row_correct = correct[row : row + items_count]
+        chosen_sets.append(set(row_choices) - {0})
+        wrong_sets.append({
+            choice_id
+            for choice_id, is_correct in zip(row_choices, row_correct)
+            if choice_id and not is_correct
+        })
+    return list(submission_ids), wrong_sets, chosen_sets
+
+
+def minhash_signatures(sets, hashes_count, seed=0):
+    """Returns the MinHash signature of every set, `hashes_count` minimums of
+    random universal hashes of its elements (None for an empty set).
+    An exam has few distinct choices, so the hashes of every choice are computed
+    once and a signature is the element-wise min of the hashes of its choices."""
+    rng = random.Random(seed)
+    coefficients = [
+        (rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(hashes_count)
+    ]
+    hashes = {
+        element: [(a * element + b) % _PRIME for a, b in coefficients]
+        for element in set().union(*sets)
+    }
+    signatures = []
+    for elements in sets:
+        vectors = [hashes[element] for element in elements]
+        if len(vectors) > 1:
+            signatures.append(list(map(min, *vectors)))
+        else:
+            signatures.append(vectors[0] if vectors else None)
+    return signatures
+
+
+def candidate_pairs(signatures, bands, rows, max_bucket_size=100):
+    """Finds the pairs of signatures that are equal on all the rows of at least one
+    band (LSH banding), so that sets with a Jaccard similarity s are paired with
+    probability 1 - (1 - s ** rows) ** bands, without comparing all the pairs.
+    Buckets larger than `max_bucket_size` are skipped to stay near linear.
+    Returns the set of (i, j) index pairs and the number of skipped buckets."""
+    buckets = defaultdict(list)
+    for index, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        for band in range(bands):
+            key = (band, *signature[band * rows : (band + 1) * rows])
+            buckets[key].append(index)
+
+    pairs = set()
+    skipped = 0
+    for bucket in buckets.values():
+        if len(bucket) > max_bucket_size:
+            skipped += 1
+            continue
+        pairs.update(combinations(bucket, 2))
+    return pairs, skipped
+
+
+def score_pair(first_wrong, second_wrong, first_chosen, second_chosen):
+    """returns the shared wrong choices count, the Jaccard similarity
+    of the wrong choices and the share of identical choices of two submissions"""
+    shared_wrong = len(first_wrong & second_wrong)
+    union_wrong = len(first_wrong | second_wrong)
+    return (
+        shared_wrong,
+        shared_wrong / union_wrong if union_wrong else 0.0,
+        len(first_chosen & second_chosen) / max(len(first_chosen | second_chosen), 1),
+    )
+
+
+def _flag(first, second, wrong_sets, chosen_sets, threshold, min_shared_wrong):
+    shared_wrong, wrong_similarity, agreement = score_pair(
+        wrong_sets[first], wrong_sets[second], chosen_sets[first], chosen_sets[second]
+    )
+    if shared_wrong >= min_shared_wrong and wrong_similarity >= threshold:
+        return {
+            "pair": (first, second),
+            "shared_wrong": shared_wrong,
+            "wrong_similarity": wrong_similarity,
+            "agreement": agreement,
+        }
+    return None
+
+
+def find_similar_pairs(
+    wrong_sets,
+    chosen_sets,
+    threshold=0.6,
+    min_shared_wrong=3,
+    bands=16,
+    rows=4,
+    max_bucket_size=100,
+):
+    """Flags the pairs of submissions that share suspiciously many wrong choices:
+    a Jaccard similarity of their wrong choices of at least `threshold`
+    with at least `min_shared_wrong` of them in common.
+    Candidate pairs come from MinHash / LSH over the wrong choices sets,
+    then they are scored exactly.
+    Returns the flagged pairs, sorted by shared wrong choices,
+    the number of candidates and the number of skipped buckets."""
+    # submissions with few wrong choices cannot share enough of them
+    signed_sets = [
+        wrong if len(wrong) >= min_shared_wrong else set() for wrong in wrong_sets
+    ]
+    signatures = minhash_signatures(signed_sets, bands * rows)
+    pairs, skipped = candidate_pairs(signatures, bands, rows, max_bucket_size)
+    flagged = [
+        result
+        for first, second in pairs
+        if (
+            result := _flag(
+                first, second, wrong_sets, chosen_sets, threshold, min_shared_wrong
+            )
+        )
+    ]
+    flagged.sort(
+        key=lambda result: (result["shared_wrong"], result["wrong_similarity"]),
+        reverse=True,
+    )
+    return flagged, len(pairs), skipped
+
+
+def naive_similar_pairs(wrong_sets, chosen_sets, threshold=0.6, min_shared_wrong=3):
+    """Reference implementation scoring every pair of submissions,
+    used to check and benchmark find_similar_pairs."""
+    return [
+        result
+        for first, second in combinations(range(len(wrong_sets)), 2)
+        if (
+            result := _flag(
+                first, second, wrong_sets, chosen_sets, threshold, min_shared_wrong
+            )
+        )
+    ]
+
+
+def find_similar_submissions(exam, **options):
+    """Flags the pairs of completed submissions of an exam that share suspiciously
+    many wrong choices (see find_similar_pairs for the options),
+    with their submission ids and usernames"""
+    submission_ids, wrong_sets, chosen_sets = wrong_choice_sets(exam)
+    flagged, candidates_count, skipped = find_similar_pairs(
+        wrong_sets, chosen_sets, **options
+    )
+
+    for result in flagged:
+        result["submissions"] = tuple(submission_ids[i] for i in result.pop("pair"))
+    usernames = dict(
+        Submission.objects.filter(
+            id__in={i for result in flagged for i in result["submissions"]}
+        ).values_list("id", "user__username")
+    )
+    for result in flagged:
+        result["usernames"] = tuple(usernames.get(i) for i in result["submissions"])
+
+    return {
+        "submissions_count": len(submission_ids),
+        "candidates_count": candidates_count,
+        "skipped_buckets": skipped,
+        "pairs": flagged,
+    }
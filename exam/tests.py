@@ -1 +1,825 @@
-# Create your tests here.
+import csv
+import datetime
+import json
+import math
+import os
+import random
+import tempfile
+from array import array
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from exam.analysis import analyze_responses, naive_analysis
+from exam.calibration import ResponseData, calibrate, difficulty_level
+from exam.export import EXPORT_FIELDS, export_rows, stream_export
+from exam.models import (
+    Answer,
+    Exam,
+    ExamLeaderboard,
+    ExamProblem,
+    ProblemStats,
+    Submission,
+)
+from exam.service import (
+    _sample_excluding,
+    _split_quota,
+    correct_exam,
+    get_answer_key,
+    get_exam_leaderboard,
+    get_exam_payload,
+    get_submission_result,
+    regrade_exam,
+    sample_problem_ids,
+    sample_stratified_problem_ids,
+)
+from exam.similarity import (
+    find_similar_pairs,
+    find_similar_submissions,
+    naive_similar_pairs,
+)
+from exam.utils import get_exams, parse_difficulty_mix
+from problem.models import Choice, Problem
+from problem.pools import invalidate_problem_pools
+from scope.models import Scope
+from tracker.bitset import Bitset
+from tracker.models import LessonMastery, UserStats
+
+
+class GetExamsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("student")
+        cls.user.exam_tracker.max_exams_per_week = 100
+        cls.user.exam_tracker.save()
+
+        textbook = Scope(title="Physics", level=Scope.LevelChoices.TEXTBOOK)
+        textbook.save()
+        cls.lesson = Scope(
+            title="Vectors",
+            level=Scope.LevelChoices.LESSON,
+            parent=textbook,
+            in_scope_order=1,
+        )
+        cls.lesson.save()
+        cls.scopes = [textbook, cls.lesson]
+        cls.problems = [
+            Problem.objects.create(scope=cls.lesson, body=f"Problem {i}")
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.request = RequestFactory().get("/")
+        self.request.user = self.user
+
+    def create_exams(self, count):
+        for i in range(count):
+            exam = Exam.objects.create(title=f"Exam {i}", created_by=self.user)
+            exam.scopes.set(self.scopes)
+            ExamProblem.objects.bulk_create(
+                ExamProblem(exam=exam, problem=problem, order=order)
+                for order, problem in enumerate(self.problems, start=1)
+            )
+            Submission.objects.create(
+                exam=exam,
+                user=self.user,
+                score=2,
+                percentage=2 / 3 * 100,
+                status=Submission.Status.COMPLETED,
+            )
+
+    def test_query_count_does_not_grow_with_exams(self):
+        self.create_exams(1)
+        with self.assertNumQueries(2):
+            get_exams(self.request)
+
+        self.create_exams(10)
+        with self.assertNumQueries(2):
+            exams = get_exams(self.request)
+        self.assertEqual(len(exams), 11)
+
+    def test_exam_fields(self):
+        self.create_exams(1)
+        exam = get_exams(self.request)[0]
+        self.assertEqual(exam["exam_length"], 3)
+        self.assertEqual(exam["scope"]["type"], "multiple")
+        self.assertEqual(exam["scope"]["title"], "Textbook: Physics, Lesson: Vectors")
+        self.assertEqual(exam["submission"]["score"], 2)
+        self.assertEqual(exam["submission"]["status"], Submission.Status.COMPLETED)
+
+    def test_solved_filter_and_limit(self):
+        self.create_exams(3)
+        Exam.objects.create(title="Pending", created_by=self.user)
+
+        self.assertEqual(len(get_exams(self.request)), 4)
+        self.assertEqual(len(get_exams(self.request, solved=True)), 3)
+        self.assertEqual(len(get_exams(self.request, limit=2, solved=True)), 2)
+        pending = get_exams(self.request, limit=1)[0]
+        self.assertEqual(pending["title"], "Pending")
+        self.assertIsNone(pending["submission"])
+        self.assertEqual(pending["exam_length"], 0)
+
+
+class ExamCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("student")
+        textbook = Scope(title="Physics", level=Scope.LevelChoices.TEXTBOOK)
+        textbook.save()
+        cls.lessons = []
+        for order, title in enumerate(["Vectors", "Forces"], start=1):
+            lesson = Scope(
+                title=title,
+                level=Scope.LevelChoices.LESSON,
+                parent=textbook,
+                in_scope_order=order,
+            )
+            lesson.save()
+            cls.lessons.append(lesson)
+            # two easy and two medium problems in each lesson
+            Problem.objects.bulk_create(
+                Problem(
+                    scope=lesson,
+                    body=f"{title} {i}",
+                    difficulty=Problem.Difficulty.EASY + i // 2,
+                    is_published=True,
+                )
+                for i in range(4)
+            )
+
+    def setUp(self):
+        invalidate_problem_pools()
+        self.client.force_login(self.user)
+
+    def create(self, **data):
+        return self.client.post(
+            "/exam/create/",
+            {
+                "exam-type": "multi_scope",
+                "scope_ids": [lesson.id for lesson in self.lessons],
+                **data,
+            },
+        )
+
+    def test_number_of_problems(self):
+        response = self.create(number_of_problems="5")
+        exam = Exam.objects.get()
+        self.assertRedirects(
+            response, f"/exam/{exam.id}/", fetch_redirect_response=False
+        )
+        self.assertEqual(exam.exam_problems.count(), 5)
+
+    def test_invalid_number_of_problems(self):
+        for value in ["-3", "0", "five"]:
+            response = self.create(number_of_problems=value)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn(
+                f"Invalid number of problems: {value}",
+                [str(message) for message in get_messages(response.wsgi_request)],
+            )
+        self.assertFalse(Exam.objects.exists())
+
+    def test_difficulty_mix_needs_a_number_of_problems(self):
+        response = self.create(difficulty_mix="40,40,15,5")
+        self.assertIn(
+            "Please enter the number of problems to use a difficulty mix",
+            [str(message) for message in get_messages(response.wsgi_request)],
+        )
+        self.assertFalse(Exam.objects.exists())
+
+        self.create(difficulty_mix="50,50,0,0", number_of_problems="4")
+        self.assertEqual(
+            sorted(Exam.objects.get().problems.values_list("difficulty", flat=True)),
+            [1, 1, 2, 2],
+        )
+
+    def test_stratified_sample_splits_scopes_and_difficulties(self):
+        mix = parse_difficulty_mix("50,50,0,0")
+        sample = sample_stratified_problem_ids(self.lessons, 4, mix)
+        strata = Problem.objects.filter(id__in=sample).values_list(
+            "scope_id", "difficulty"
+        )
+        self.assertEqual(len(sample), 4)
+        self.assertEqual(
+            sorted(strata),
+            sorted(
+                (lesson.id, difficulty)
+                for lesson in self.lessons
+                for difficulty in [1, 2]
+            ),
+        )
+
+    def test_stratified_sample_tops_up_empty_difficulties(self):
+        # there are no hard problems, so the hard quotas come from the rest
+        mix = parse_difficulty_mix("0,0,1,0")
+        sample = sample_stratified_problem_ids(self.lessons, 6, mix)
+        self.assertEqual(len(set(sample)), 6)
+        sample = sample_stratified_problem_ids(self.lessons, 20, mix)
+        self.assertEqual(len(set(sample)), 8)
+
+    def test_sampling_nothing(self):
+        mix = {difficulty: 1 for difficulty in Problem.Difficulty.values}
+        for size in [0, -3]:
+            self.assertEqual(sample_problem_ids(self.lessons, size), ([], 8))
+            self.assertEqual(sample_stratified_problem_ids(self.lessons, size, mix), [])
+
+
+class DifficultyMixTests(SimpleTestCase):
+    def test_split_quota(self):
+        self.assertEqual(_split_quota(7, [40, 40, 15, 5]), [3, 3, 1, 0])
+        self.assertEqual(_split_quota(10, [40, 40, 15, 5]), [4, 4, 2, 0])
+        self.assertEqual(_split_quota(5, [1, 1, 1]), [2, 2, 1])
+        self.assertEqual(_split_quota(0, [70, 20, 10, 0]), [0, 0, 0, 0])
+
+    def test_parse_difficulty_mix(self):
+        self.assertEqual(
+            parse_difficulty_mix("70,20,10,0"), {1: 70, 2: 20, 3: 10, 4: 0}
+        )
+        for value in ["40,40,20", "40,40,15,5,1", "-5,40,40,25", "0,0,0,0", "a"]:
+            with self.assertRaises(ValueError):
+                parse_difficulty_mix(value)
+
+
+class AnalyzeResponsesTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.answer_key = [
+            [order, order, [order * 10 + 1], [order * 10 + 1, order * 10 + 2]]
+            for order in range(1, 21)
+        ]
+        self.choices = []
+        for _ in range(200):
+            ability = rng.random()
+            for order in range(1, 21):
+                if rng.random() < 0.05:
+                    self.choices.append(0)
+                elif rng.random() < ability:
+                    self.choices.append(order * 10 + 1)
+                else:
+                    self.choices.append(order * 10 + 2)
+        self.correct = bytearray(choice % 10 == 1 for choice in self.choices)
+
+    def test_matches_naive_implementation(self):
+        analysis = analyze_responses(self.answer_key, self.choices, self.correct)
+        naive = naive_analysis(self.answer_key, self.choices, self.correct)
+
+        self.assertEqual(analysis["students_count"], 200)
+        self.assertAlmostEqual(analysis["reliability"], naive["reliability"])
+        for item, p_value, discrimination, counts in zip(
+            analysis["items"],
+            naive["p_values"],
+            naive["discriminations"],
+            naive["choice_counts"],
+        ):
+            self.assertAlmostEqual(item["p_value"], p_value)
+            self.assertAlmostEqual(item["discrimination"], discrimination)
+            self.assertEqual(item["omitted"], counts.get(0, 0))
+            for choice in item["choices"]:
+                self.assertEqual(choice["count"], counts.get(choice["id"], 0))
+
+    def test_distractors_count_every_answer(self):
+        analysis = analyze_responses(self.answer_key, self.choices, self.correct)
+        for item in analysis["items"]:
+            answered = sum(choice["count"] for choice in item["choices"])
+            self.assertEqual(answered + item["omitted"], 200)
+            self.assertGreaterEqual(item["upper_lower_index"], -1)
+            self.assertLessEqual(item["upper_lower_index"], 1)
+
+    def test_no_submissions(self):
+        analysis = analyze_responses(self.answer_key, [], bytearray())
+        self.assertEqual(analysis["students_count"], 0)
+        self.assertEqual(analysis["items"], [])
+
+
+class CalibrateTests(SimpleTestCase):
+    def test_recovers_difficulties_from_sparse_responses(self):
+        rng = random.Random(0)
+        true_difficulties = [rng.gauss(0, 1) for _ in range(50)]
+        student_ptr = array("Q", [0])
+        student_items = array("I")
+        student_scores = array("I")
+        item_scores = array("I", [0] * 50)
+        for _ in range(3000):
+            ability = rng.gauss(0, 1)
+            score = 0
+            for item in rng.sample(range(50), 10):
+                student_items.append(item)
+                if rng.random() < 1 / (1 + math.exp(true_difficulties[item] - ability)):
+                    score += 1
+                    item_scores[item] += 1
+            student_scores.append(score)
+            student_ptr.append(len(student_items))
+        data = ResponseData(
+            array("I", range(50)),
+            student_ptr,
+            student_items,
+            item_scores,
+            student_scores,
+        )
+
+        difficulties, _, _, converged = calibrate(data)
+
+        self.assertTrue(converged)
+        self.assertAlmostEqual(sum(difficulties), 0)
+        mean = sum(true_difficulties) / 50
+        for difficulty, true_difficulty in zip(difficulties, true_difficulties):
+            self.assertAlmostEqual(difficulty, true_difficulty - mean, delta=0.5)
+
+    def test_difficulty_level(self):
+        thresholds = [-1, 0, 1]
+        self.assertEqual(difficulty_level(-2.5, thresholds), Problem.Difficulty.EASY)
+        self.assertEqual(difficulty_level(-0.5, thresholds), Problem.Difficulty.MIDIUM)
+        self.assertEqual(difficulty_level(0.5, thresholds), Problem.Difficulty.HARD)
+        self.assertEqual(difficulty_level(3, thresholds), Problem.Difficulty.EXTRA)
+
+
+class SampleUnseenTests(SimpleTestCase):
+    def test_prefers_unseen_problems(self):
+        seen = Bitset()
+        seen.update(range(0, 100, 2))
+        picked = _sample_excluding(list(range(100)), 30, set(), seen)
+        self.assertEqual(len(set(picked)), 30)
+        self.assertFalse(any(problem_id in seen for problem_id in picked))
+
+    def test_tops_up_with_seen_problems(self):
+        seen = Bitset()
+        seen.update(range(0, 100, 2))
+        picked = _sample_excluding(list(range(100)), 60, {1, 3}, seen)
+        self.assertEqual(len(set(picked)), 60)
+        self.assertEqual(sum(problem_id not in seen for problem_id in picked), 48)
+        self.assertNotIn(1, picked)
+
+
+class SimilarPairsTests(SimpleTestCase):
+    def test_finds_the_copied_submissions(self):
+        rng = random.Random(0)
+        # 30 problems with 3 wrong choices each
+        wrong_sets = [
+            {problem * 10 + rng.randint(1, 3) for problem in rng.sample(range(30), 12)}
+            for _ in range(300)
+        ]
+        for original, copy in [(0, 1), (10, 20), (30, 40)]:
+            wrong_sets[copy] = set(wrong_sets[original])
+            wrong_sets[copy].pop()
+        chosen_sets = [set(wrong) for wrong in wrong_sets]
+
+        flagged, candidates_count, _ = find_similar_pairs(wrong_sets, chosen_sets)
+        expected = naive_similar_pairs(wrong_sets, chosen_sets)
+
+        self.assertEqual(
+            {result["pair"] for result in flagged},
+            {result["pair"] for result in expected},
+        )
+        self.assertTrue({(0, 1), (10, 20), (30, 40)} <= {r["pair"] for r in flagged})
+        self.assertLess(candidates_count, 300 * 299 / 2 / 10)
+
+
+class FindSimilarSubmissionsTests(TestCase):
+    def test_exam_without_problems(self):
+        user = User.objects.create_user("student")
+        exam = Exam.objects.create(title="Empty", created_by=user)
+        Submission.objects.create(
+            exam=exam, user=user, status=Submission.Status.COMPLETED
+        )
+        result = find_similar_submissions(exam)
+        self.assertEqual(result["submissions_count"], 1)
+        self.assertEqual(result["pairs"], [])
+
+
+class GradedExamTestCase(TestCase):
+    """An exam of four problems, two in each of two lessons, whose first choice
+    is the correct one, with a helper to grade submissions of it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f"student{i}") for i in range(3)]
+        textbook = Scope(title="Physics", level=Scope.LevelChoices.TEXTBOOK)
+        textbook.save()
+        cls.lessons = []
+        for order, title in enumerate(["Vectors", "Forces"], start=1):
+            lesson = Scope(
+                title=title,
+                level=Scope.LevelChoices.LESSON,
+                parent=textbook,
+                in_scope_order=order,
+            )
+            lesson.save()
+            cls.lessons.append(lesson)
+        cls.exam = Exam.objects.create(title="Exam", created_by=cls.users[0])
+        cls.problems = []
+        cls.choices = []
+        for order in range(1, 5):
+            problem = Problem.objects.create(
+                scope=cls.lessons[(order - 1) // 2], body=f"Problem {order}"
+            )
+            ExamProblem.objects.create(exam=cls.exam, problem=problem, order=order)
+            cls.problems.append(problem)
+            cls.choices.append(
+                [
+                    Choice.objects.create(
+                        problem=problem, body="right", is_correct=True
+                    ),
+                    Choice.objects.create(problem=problem, body="wrong"),
+                ]
+            )
+
+    def setUp(self):
+        # the leaderboards are cached by exam id, and ids repeat between tests
+        cache.clear()
+
+    def answers(self, picks):
+        """returns the submitted answers of `picks`, the index of the chosen
+        choice of each problem, None to leave it unanswered"""
+        return {
+            f"problem_{order}": str(choices[pick].id)
+            for order, (choices, pick) in enumerate(zip(self.choices, picks), start=1)
+            if pick is not None
+        }
+
+    def submit(self, user, picks):
+        """grades a new submission of the user and runs the on commit updates"""
+        submission = Submission.objects.create(exam=self.exam, user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            correct_exam(self.exam, submission, self.answers(picks))
+        return submission
+
+
+class GradingTests(GradedExamTestCase):
+    def test_grades_the_answers(self):
+        submission = self.submit(self.users[0], [0, 1, 0, None])
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, Submission.Status.COMPLETED)
+        self.assertEqual(submission.score, 2)
+        self.assertEqual(submission.percentage, 50)
+        self.assertEqual(submission.answers.count(), 3)
+
+    def test_ignores_invalid_answers(self):
+        submission = Submission.objects.create(exam=self.exam, user=self.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            correct_exam(
+                self.exam,
+                submission,
+                # a choice of another problem, not a number, an unknown problem
+                {
+                    "problem_1": str(self.choices[1][0].id),
+                    "problem_2": "x",
+                    "problem_9": str(self.choices[0][0].id),
+                },
+            )
+        self.assertEqual(submission.score, 0)
+        self.assertFalse(submission.answers.exists())
+
+    def test_query_count_does_not_grow_with_answers(self):
+        get_answer_key(self.exam)
+        for user, picks in [
+            (self.users[0], [0, None, None, None]),
+            (self.users[1], [0, 0, 0, 0]),
+        ]:
+            submission = Submission.objects.create(exam=self.exam, user=user)
+            # the problems stats and the leaderboard are written on commit
+            with self.assertNumQueries(18):
+                with self.captureOnCommitCallbacks() as callbacks:
+                    correct_exam(self.exam, submission, self.answers(picks))
+            self.assertEqual(len(callbacks), 2)
+
+    def test_grades_a_submission_once(self):
+        for picks in [[None] * 4, [0, 1, 0, 1]]:
+            submission = Submission.objects.create(exam=self.exam, user=self.users[0])
+            # the second request read the submission before the first one graded it
+            stale = Submission.objects.get(pk=submission.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(
+                    correct_exam(self.exam, submission, self.answers(picks))
+                )
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.assertFalse(correct_exam(self.exam, stale, self.answers(picks)))
+            self.assertEqual(callbacks, [])
+
+        self.assertEqual(Answer.objects.count(), 4)
+        self.assertEqual(UserStats.objects.get(user=self.users[0]).submissions_count, 2)
+        self.assertEqual(
+            ExamLeaderboard.objects.get(exam=self.exam).submissions_count, 2
+        )
+
+
+class SubmissionResultTests(GradedExamTestCase):
+    def test_result_snapshot(self):
+        submission = self.submit(self.users[0], [0, 1, None, None])
+        result = submission.result
+        self.assertEqual(
+            [problem["id"] for problem in result],
+            [problem.id for problem in self.problems],
+        )
+        self.assertEqual(
+            [problem["answered_correctly"] for problem in result],
+            [True, False, False, False],
+        )
+        self.assertEqual(
+            [choice["checked"] for choice in result[1]["choices"]], [False, True]
+        )
+
+        # a missing snapshot is rebuilt from the answers and stored
+        Submission.objects.filter(pk=submission.pk).update(result=None)
+        submission.refresh_from_db()
+        self.assertEqual(get_submission_result(submission), result)
+        submission.refresh_from_db()
+        self.assertEqual(submission.result, result)
+
+    def test_result_page_renders_the_snapshot(self):
+        submission = self.submit(self.users[0], [0, 0, 1, None])
+        # later edits of the problems do not change a graded result
+        self.problems[0].body = "Edited"
+        self.problems[0].save()
+
+        self.client.force_login(self.users[0])
+        response = self.client.get(f"/exam/result/{submission.id}/")
+        self.assertEqual(response.context["problems"], submission.result)
+        self.assertEqual(response.context["problems"][0]["body"], "Problem 1")
+        self.assertEqual(response.context["wrong_answers"], 2)
+
+
+class LeaderboardTests(GradedExamTestCase):
+    def test_leaderboard(self):
+        first = self.submit(self.users[0], [0, 0, 0, 1])
+        second = self.submit(self.users[1], [0, 0, 0, 0])
+        third = self.submit(self.users[2], [1, 1, 1, 1])
+
+        leaderboard = ExamLeaderboard.objects.get(exam=self.exam)
+        self.assertEqual(leaderboard.submissions_count, 3)
+        self.assertEqual(
+            [entry["submission_id"] for entry in leaderboard.top],
+            [second.id, first.id, third.id],
+        )
+        self.assertEqual(leaderboard.rank(75), (2, 50))
+        self.assertEqual(leaderboard.rank(100), (1, 100))
+        self.assertEqual(leaderboard.rank(0), (3, 0))
+        self.assertEqual(
+            get_exam_leaderboard(self.exam.id).histogram, leaderboard.histogram
+        )
+
+    def test_top_is_trimmed(self):
+        leaderboard = ExamLeaderboard(exam=self.exam)
+        for submission_id in range(ExamLeaderboard.TOP_LENGTH + 5):
+            leaderboard.add_score(submission_id, "student", submission_id)
+        self.assertEqual(len(leaderboard.top), ExamLeaderboard.TOP_LENGTH)
+        self.assertEqual(
+            leaderboard.top[0]["submission_id"], ExamLeaderboard.TOP_LENGTH + 4
+        )
+        self.assertEqual(leaderboard.submissions_count, ExamLeaderboard.TOP_LENGTH + 5)
+
+    def test_leaderboard_endpoint(self):
+        submission = self.submit(self.users[1], [0, 0, 1, 1])
+        self.client.force_login(self.users[1])
+        # the exam is not published and the user did not create it
+        response = self.client.get(f"/exam/{self.exam.id}/leaderboard/")
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.users[0])
+        response = self.client.get(f"/exam/{self.exam.id}/leaderboard/")
+        self.assertEqual(response.json()["submissions_count"], 1)
+        self.assertEqual(
+            response.json()["top"],
+            [
+                {
+                    "submission_id": submission.id,
+                    "username": "student1",
+                    "percentage": 50,
+                }
+            ],
+        )
+
+
+class ExportTests(GradedExamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = self.submit(self.users[0], [0, 1, None, None])
+        self.second = self.submit(self.users[1], [1, 0, 0, 1])
+        # an old submission, and one that is not completed
+        Submission.objects.filter(pk=self.first.pk).update(
+            updated_at=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        Submission.objects.create(exam=self.exam, user=self.users[2])
+        self.users[0].is_staff = True
+        self.users[0].save()
+
+    def export(self, **params):
+        self.client.force_login(self.users[0])
+        return self.client.get("/exam/export/", params)
+
+    def test_csv(self):
+        response = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(
+            csv.reader(b"".join(response.streaming_content).decode().splitlines())
+        )
+        self.assertEqual(rows[0], list(EXPORT_FIELDS))
+        self.assertEqual(len(rows), 1 + 6)
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first["submission_id"], str(self.first.id))
+        self.assertEqual(first["username"], "student0")
+        self.assertEqual(first["problem_id"], str(self.problems[0].id))
+        self.assertEqual(first["lesson_title"], "Vectors")
+        self.assertEqual(first["is_correct"], "True")
+
+    def test_jsonl(self):
+        response = self.export(format="jsonl")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(list(rows[-1]), list(EXPORT_FIELDS))
+        self.assertEqual(rows[-1]["submission_id"], self.second.id)
+        self.assertEqual(rows[-1]["percentage"], 50)
+
+    def test_filters(self):
+        def submissions(**filters):
+            return {row[0] for row in export_rows(**filters)}
+
+        self.assertEqual(submissions(since=datetime.date(2024, 1, 2)), {self.second.id})
+        self.assertEqual(submissions(until=datetime.date(2024, 1, 1)), {self.first.id})
+        self.assertEqual(submissions(user_ids=[self.users[0].id]), {self.first.id})
+        rows = export_rows(scope=self.lessons[1])
+        self.assertEqual(
+            {row[list(EXPORT_FIELDS).index("problem_id")] for row in rows},
+            {problem.id for problem in self.problems[2:]},
+        )
+        self.assertEqual(rows.count(), 2)
+        # no rows, only the csv header
+        self.assertEqual(
+            len(list(stream_export(export_rows(exam_ids=[0]), chunk_size=1))), 1
+        )
+
+    def test_endpoint_filters(self):
+        response = self.export(
+            format="jsonl", since="2024-01-02", scope=self.lessons[0].id
+        )
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(self.export(scope=999999).status_code, 404)
+
+    def test_invalid_filters(self):
+        for params in [
+            {"since": "bad"},
+            {"until": "2024-13-01"},
+            {"exam": "x"},
+            {"format": "xml"},
+        ]:
+            self.assertEqual(self.export(**params).status_code, 400, params)
+        with self.assertRaisesMessage(CommandError, "Invalid date: bad"):
+            call_command("export_answers", "--since", "bad")
+        with self.assertRaisesMessage(CommandError, "Invalid date: 2024-02-30"):
+            call_command("export_answers", "--until", "2024-02-30")
+
+    def test_staff_only(self):
+        self.client.force_login(self.users[1])
+        response = self.client.get("/exam/export/")
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("/admin/login/", response["Location"])
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "answers.jsonl")
+            call_command(
+                "export_answers",
+                "--format",
+                "jsonl",
+                "--user",
+                str(self.users[1].id),
+                "--output",
+                path,
+                stderr=StringIO(),
+            )
+            with open(path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual({row["submission_id"] for row in rows}, {self.second.id})
+        self.assertEqual(len(rows), 4)
+
+
+class ProblemStatsTests(GradedExamTestCase):
+    def test_grading_updates_the_stats(self):
+        self.submit(self.users[0], [0, 0, 0, 0])
+        self.submit(self.users[1], [1, 0, None, None])
+        stats = ProblemStats.objects.in_bulk()
+        first = stats[self.problems[0].id]
+        self.assertEqual(first.attempts, 2)
+        self.assertEqual(first.correct_count, 1)
+        self.assertEqual(
+            first.choice_counts,
+            {str(self.choices[0][0].id): 1, str(self.choices[0][1].id): 1},
+        )
+        self.assertEqual(first.score_sum, 125)
+        self.assertEqual(first.correct_score_sum, 100)
+        self.assertEqual(first.p_value, 0.5)
+        self.assertEqual(first.discrimination, 1)
+        self.assertEqual(stats[self.problems[1].id].correct_count, 2)
+        self.assertIsNone(stats[self.problems[1].id].discrimination)
+        self.assertEqual(stats[self.problems[2].id].attempts, 1)
+
+    def test_rebuild_matches_the_incremental_stats(self):
+        self.submit(self.users[0], [0, 1, 0, None])
+        self.submit(self.users[1], [1, 0, 1, 1])
+        self.submit(self.users[2], [0, 0, None, 1])
+        fields = ["attempts", "correct_count", "choice_counts", "score_sum"]
+        stats = list(ProblemStats.objects.order_by("problem").values(*fields))
+        ProblemStats.objects.all().delete()
+
+        call_command("rebuild_problem_stats", batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            list(ProblemStats.objects.order_by("problem").values(*fields)), stats
+        )
+
+
+class RegradeTests(GradedExamTestCase):
+    def test_regrade(self):
+        first = self.submit(self.users[0], [0, 0, 1, None])
+        second = self.submit(self.users[1], [1, 1, 1, 1])
+        # the correct choice of the third problem is swapped without signals
+        Choice.objects.filter(pk=self.choices[2][0].pk).update(is_correct=False)
+        Choice.objects.filter(pk=self.choices[2][1].pk).update(is_correct=True)
+
+        self.assertEqual(regrade_exam(self.exam), (2, 7, 2))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.score, first.percentage), (3, 75))
+        self.assertEqual((second.score, second.percentage), (1, 25))
+        self.assertIsNone(first.result)
+
+        # the aggregates built from the old grades are rebuilt
+        stats = ProblemStats.objects.get(problem=self.problems[2])
+        self.assertEqual((stats.attempts, stats.correct_count), (2, 2))
+        self.assertEqual(stats.correct_score_sum, 100)
+        self.assertEqual(UserStats.objects.get(user=self.users[0]).last_scores, [75])
+        mastery = LessonMastery.objects.get(user=self.users[0], scope=self.lessons[1])
+        self.assertEqual((mastery.attempted, mastery.correct), (1, 1))
+        leaderboard = ExamLeaderboard.objects.get(exam=self.exam)
+        self.assertEqual(leaderboard.top[0]["submission_id"], first.id)
+
+    def test_regrade_after_the_exam_length_changed(self):
+        submission = self.submit(self.users[0], [0, 0, 0, 0])
+        ExamProblem.objects.filter(exam=self.exam, order=4).delete()
+
+        self.assertEqual(regrade_exam(self.exam), (1, 4, 1))
+        submission.refresh_from_db()
+        self.assertEqual(submission.score, 3)
+        self.assertEqual(submission.percentage, 100)
+        self.assertEqual(UserStats.objects.get(user=self.users[0]).last_scores, [100])
+
+    def test_unchanged_submissions_are_not_written(self):
+        self.submit(self.users[0], [0, 1, 0, 1])
+        self.assertEqual(regrade_exam(self.exam), (1, 4, 0))
+
+
+class ExamSnapshotTests(GradedExamTestCase):
+    def setUp(self):
+        super().setUp()
+        get_answer_key(self.exam)
+
+    def assertCleared(self):
+        self.exam.refresh_from_db()
+        self.assertIsNone(self.exam.payload)
+        self.assertIsNone(self.exam.answer_key)
+
+    def test_correct_choice_change_rebuilds_the_answer_key(self):
+        right, wrong = self.choices[0]
+        right.is_correct, wrong.is_correct = False, True
+        right.save()
+        wrong.save()
+        self.assertCleared()
+
+        self.assertEqual(get_answer_key(self.exam)[0][2], [wrong.id])
+        submission = self.submit(self.users[0], [1, 0, 0, 0])
+        self.assertEqual(submission.score, 4)
+
+    def test_choice_delete_and_problem_edit(self):
+        self.choices[1][1].delete()
+        self.assertCleared()
+        self.assertEqual(len(get_exam_payload(self.exam)[1]["choices"]), 1)
+
+        self.problems[2].body = "Edited"
+        self.problems[2].save()
+        self.assertCleared()
+        self.assertEqual(get_exam_payload(self.exam)[2]["body"], "Edited")
+
+    def test_exam_problems_change(self):
+        ExamProblem.objects.get(exam=self.exam, order=4).delete()
+        self.assertCleared()
+        self.assertEqual(len(get_answer_key(self.exam)), 3)
+
+        ExamProblem.objects.create(exam=self.exam, problem=self.problems[3], order=5)
+        self.assertCleared()
+        self.assertEqual([row[0] for row in get_answer_key(self.exam)], [1, 2, 3, 5])
+
+    def test_other_exams_are_kept(self):
+        other = Exam.objects.create(title="Other", created_by=self.users[0])
+        ExamProblem.objects.create(exam=other, problem=self.problems[0], order=1)
+        get_answer_key(other)
+        self.choices[3][0].save()
+        other.refresh_from_db()
+        self.assertIsNotNone(other.answer_key)
+        self.assertCleared()
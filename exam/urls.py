@@ -2,10 +2,14 @@ from django.urls import path
 
 from exam.views import (
     create_custom_exam,
+    exam_analysis,
     exam_create,
+    exam_leaderboard,
     exam_list,
     exam_result,
+    exam_similarity,
     exam_view,
+    export_answers,
     submit_exam,
 )
 
@@ -16,4 +20,8 @@ urlpatterns = [
     path("custom/", create_custom_exam, name="exam-custom"),
     path("solve/<int:exam_id>/", submit_exam, name="exam-solve"),
     path("result/<int:submission_id>/", exam_result, name="exam-result"),
+    path("<int:exam_id>/leaderboard/", exam_leaderboard, name="exam-leaderboard"),
+    path("<int:exam_id>/analysis/", exam_analysis, name="exam-analysis"),
+    path("<int:exam_id>/similarity/", exam_similarity, name="exam-similarity"),
+    path("export/", export_answers, name="exam-export"),
 ]
\ No newline at end of file
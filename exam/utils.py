@@ -1,6 +1,10 @@
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.shortcuts import redirect
 
-from exam.models import Exam
+from exam.models import Exam, ExamProblem, Submission
+from problem.models import Problem
+from scope.models import Scope
 
 scope_problem_number = {
     "Lesson": 10,
@@ -9,6 +13,24 @@ scope_problem_number = {
     "Textbook": 50,
 }
 
+# difficulty mixes offered in the create exam page,
+# the weights are for Easy, Medium, Hard and Extra hard respectively
+difficulty_mixes = {
+    "40,40,15,5": "Balanced (40% easy, 40% medium, 15% hard, 5% extra hard)",
+    "70,20,10,0": "Mostly easy (70% easy, 20% medium, 10% hard)",
+    "10,30,40,20": "Challenging (10% easy, 30% medium, 40% hard, 20% extra hard)",
+}
+
+
+def parse_difficulty_mix(value) -> dict:
+    """Parses a difficulty mix like "40,40,15,5" into a map of difficulty to weight.
+    Raises ValueError if it is not one non-negative weight per difficulty."""
+    weights = [int(weight) for weight in value.split(",")]
+    mix = dict(zip(Problem.Difficulty.values, weights, strict=True))
+    if any(weight < 0 for weight in weights) or not sum(weights):
+        raise ValueError(f"Invalid difficulty mix: {value}")
+    return mix
+
 
 def reload(request):
     """Reloads the current page"""
@@ -16,33 +38,71 @@ def reload(request):
 
 
 def get_exams(request, limit=None, solved=False) -> list:
-    """returns the context for exams list"""
+    """returns the context for exams list.
+    It runs two queries whatever the number of exams, one for the exams annotated
+    with their length and latest submission, and one for the titles of their scopes.
+    """
+    submissions = Submission.objects.filter(
+        exam=OuterRef("pk"), user=request.user
+    ).order_by("-updated_at")
+    exam_length = (
+        ExamProblem.objects.filter(exam=OuterRef("pk"))
+        .order_by()
+        .values("exam")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
 
-    exams = Exam.objects.filter(created_by=request.user).prefetch_related(
-        "scopes", "submissions", "exam_problems"
+    exams = Exam.objects.filter(created_by=request.user)
+    if solved:
+        exams = exams.filter(Exists(submissions))
+    exams = exams.annotate(
+        exam_length=Coalesce(Subquery(exam_length), 0),
+        submission_id=Subquery(submissions.values("id")[:1]),
+        submission_score=Subquery(submissions.values("score")[:1]),
+        submission_percentage=Subquery(submissions.values("percentage")[:1]),
+        submission_status=Subquery(submissions.values("status")[:1]),
+    ).values(
+        "id",
+        "title",
+        "created_at",
+        "exam_length",
+        "submission_id",
+        "submission_score",
+        "submission_percentage",
+        "submission_status",
     )
     if limit:
         exams = exams[:limit]
-    if solved:
-        exams = exams.filter(submissions__user=request.user)
+    exams = list(exams)
+
+    scopes = {exam["id"]: [] for exam in exams}
+    exam_scopes = (
+        Exam.scopes.through.objects.filter(exam_id__in=scopes)
+        .order_by("scope__in_scope_order")
+        .values_list("exam_id", "scope__level", "scope__title")
+    )
+    for exam_id, level, title in exam_scopes:
+        scopes[exam_id].append(f"{Scope.LevelChoices(level).label}: {title}")
+
     return [
         {
-            "id": exam.id,
-            "title": exam.title,
+            "id": exam["id"],
+            "title": exam["title"],
             "scope": {
-                "type": "single" if exam.scopes.count() == 1 else "multiple",
-                "title": ", ".join(str(scope) for scope in exam.scopes.all()),
+                "type": "single" if len(scopes[exam["id"]]) == 1 else "multiple",
+                "title": ", ".join(scopes[exam["id"]]),
             },
-            "exam_length": exam.exam_problems.count(),
-            "created_at": exam.created_at,
+            "exam_length": exam["exam_length"],
+            "created_at": exam["created_at"],
             "submission": (
                 {
-                    "id": exam.submissions.first().id,
-                    "score": exam.submissions.first().score,
-                    "percentage": exam.submissions.first().percentage,
-                    "status": exam.submissions.first().status,
+                    "id": exam["submission_id"],
+                    "score": exam["submission_score"],
+                    "percentage": exam["submission_percentage"],
+                    "status": exam["submission_status"],
                 }
-                if exam.submissions.exists()
+                if exam["submission_id"]
                 else None
             ),
         }
@@ -1,17 +1,35 @@
-import random
-
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.db.models import Prefetch
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 
-from exam.utils import get_exams, reload, scope_problem_number
-from problem.models import Problem
+from exam.utils import (
+    difficulty_mixes,
+    get_exams,
+    parse_difficulty_mix,
+    reload,
+    scope_problem_number,
+)
 from scope.models import Scope
+from scope.tree import get_scope_bundle, get_scope_tree
+from tracker.utils import get_seen_problems
 
+from .analysis import analyze_exam
+from .export import EXPORT_FORMATS, export_rows, parse_export_date, stream_export
 from .models import Exam, ExamProblem, Submission
-from .service import correct_exam
+from .service import (
+    correct_exam,
+    get_answer_key,
+    get_exam_leaderboard,
+    get_exam_payload,
+    get_submission_result,
+    sample_problem_ids,
+    sample_stratified_problem_ids,
+)
+from .similarity import find_similar_submissions
 
 
 @login_required()
@@ -29,6 +47,7 @@ def exam_create(request):
     exam_title = request.POST.get("exam_title")
     exam_type = request.POST.get("exam-type", "single_scope")
     number_of_problems = request.POST.get("number_of_problems")
+    difficulty_mix = request.POST.get("difficulty_mix")
 
     # Handle scope_ids consistently for both single and multiple scope modes
     scope_ids = request.POST.getlist("scope_ids")
@@ -77,31 +96,57 @@ def exam_create(request):
         messages.error(request, "Error validating scope IDs")
         return reload(request)
 
-    # Collect all problems from the selected scopes
-    problems = []
-    for scope in scopes:
-        problems.extend(list(scope.problems))
-
-    # Remove duplicate problems (in case of overlapping scopes)
-    unique_problems = list({problem.id: problem for problem in problems}.values())
-
-    # Determine number of problems for the exam
+    # Determine number of problems for the exam (None means all available ones)
     if exam_type == "single_scope":
         # For single scope, use predefined number based on scope type
-        target_problems = scope_problem_number.get(scopes[0].type, len(unique_problems))
+        target_problems = scope_problem_number.get(scopes[0].type)
     else:
         # For multiple scopes, use provided number or default
+        target_problems = None
         if number_of_problems:
             try:
                 target_problems = int(number_of_problems)
             except (ValueError, TypeError):
-                target_problems = len(unique_problems)
-        else:
-            target_problems = len(unique_problems)
+                target_problems = 0
+            if target_problems <= 0:
+                messages.error(
+                    request, f"Invalid number of problems: {number_of_problems}"
+                )
+                return reload(request)
+
+    # Validate the difficulty mix if one is requested
+    mix = None
+    if difficulty_mix:
+        try:
+            mix = parse_difficulty_mix(difficulty_mix)
+        except ValueError:
+            messages.error(request, f"Invalid difficulty mix: {difficulty_mix}")
+            return reload(request)
+        if target_problems is None:
+            # all the available problems can not follow a mix
+            messages.error(
+                request, "Please enter the number of problems to use a difficulty mix"
+            )
+            return reload(request)
+
+    # Randomly pick the problem ids from the selected scopes,
+    # overlapping scopes are handled by the sampling itself,
+    # and the problems the user already answered are picked last
+    seen = get_seen_problems(request.user)
+    if mix:
+        problem_ids = sample_stratified_problem_ids(scopes, target_problems, mix, seen)
+        # a short sample holds every available problem
+        available_problems = len(problem_ids)
+    else:
+        problem_ids, available_problems = sample_problem_ids(
+            scopes, target_problems, seen
+        )
+    if target_problems is None:
+        target_problems = available_problems
 
     # Validate we have enough problems
-    if len(unique_problems) < target_problems:
-        if len(unique_problems) == 0:
+    if available_problems < target_problems:
+        if available_problems == 0:
             messages.error(
                 request, "No problems are available for the selected scope(s)"
             )
@@ -109,14 +154,11 @@ def exam_create(request):
             messages.warning(
                 request,
                 f"Unfortunately, there are not enough problems for this selection. "
-                f"Only {len(unique_problems)} problem{'s' if len(unique_problems) != 1 else ''} "
-                f"{'are' if len(unique_problems) != 1 else 'is'} available.",
+                f"Only {available_problems} problem{'s' if available_problems != 1 else ''} "
+                f"{'are' if available_problems != 1 else 'is'} available.",
             )
         return redirect(request.META.get("HTTP_REFERER", "/"))
 
-    # Randomly shuffle problems to ensure variety
-    random.shuffle(unique_problems)
-
     # Generate default title if not provided
     if not exam_title or not exam_title.strip():
         if exam_type == "single_scope":
@@ -143,13 +185,17 @@ def exam_create(request):
 
         # Create exam problems with proper ordering
         exam_problems = []
-        for order, problem in enumerate(unique_problems[:target_problems], start=1):
-            exam_problem = ExamProblem(exam=exam, problem=problem, order=order)
+        for order, problem_id in enumerate(problem_ids, start=1):
+            exam_problem = ExamProblem(exam=exam, problem_id=problem_id, order=order)
             exam_problems.append(exam_problem)
 
         # Bulk create for better performance
         ExamProblem.objects.bulk_create(exam_problems)
 
+        # Freeze the exam problems and answer key,
+        # so solving, grading and results are served from the exam row
+        get_answer_key(exam)
+
         # Success message
         problem_count = len(exam_problems)
         scope_count = len(scopes)
@@ -182,27 +228,26 @@ def exam_view(request, exam_id):
 @login_required()
 @require_http_methods(["POST", "GET"])
 def submit_exam(request, exam_id):
-    exam = Exam.objects.prefetch_related(
-        "exam_problems__problem", "exam_problems__problem__choices"
-    ).get(id=exam_id)
+    exam = get_object_or_404(Exam, id=exam_id)
 
-    if exam.created_by != request.user and not exam.is_published:
+    if exam.created_by_id != request.user.id and not exam.is_published:
         messages.error(request, "You do not have permission to view this exam")
         return reload(request)
 
-    exam_problems = exam.exam_problems.all()
-
-    if exam.submissions.filter(user=request.user).exists():
+    submission = (
+        exam.submissions.filter(user=request.user).select_related("user").first()
+    )
+    if submission:
         # this handles the second visit to the page
-        # so it gets the submission first
-        submission = exam.submissions.get(user=request.user)
 
         # If the method is POST correct the exam
         if request.method == "POST":
             if submission.status == Submission.Status.COMPLETED:
                 messages.error(request, "You have already completed this exam")
                 return reload(request)
-            correct_exam(exam_problems, submission, request.POST)
+            if not correct_exam(exam, submission, request.POST):
+                # graded meanwhile by another request of the same submission
+                messages.error(request, "You have already completed this exam")
             return redirect("exam-result", submission_id=submission.id)
 
         # if the method is GET, redirect the user to the corrected page of this exam
@@ -219,7 +264,7 @@ def submit_exam(request, exam_id):
         return render(
             request,
             "exam/submit_exam.html",
-            {"exam": exam, "exam_problems": exam_problems},
+            {"exam": exam, "problems": get_exam_payload(exam)},
         )
 
 
@@ -228,22 +273,14 @@ def submit_exam(request, exam_id):
 def exam_result(request, submission_id):
     submission = (
         Submission.objects.select_related("exam")
-        .prefetch_related(
-            "answers__choice",
-            "answers__problem",
-            Prefetch(
-                "exam__problems", queryset=Problem.objects.prefetch_related("choices")
-            ),
-        )
+        .defer("exam__payload")
         .get(id=submission_id)
     )
 
-    if submission.user != request.user:
+    if submission.user_id != request.user.id:
         messages.error(request, "You do not have permission to view this result")
         return reload(request)
 
-    problems = list(submission.exam.problems.all())
-
     if submission.status == Submission.Status.EXITED_UNEXPECTEDLY:
         messages.error(
             request, "You exited this exam unexpectedly, so there is no results."
@@ -255,47 +292,28 @@ def exam_result(request, submission_id):
                 "score": "-",
                 "wrong_answers": "-",
                 "percentage": "-",
-                "exam_length": len(problems),
+                "exam_length": len(get_answer_key(submission.exam)),
                 "exam_title": submission.exam.title,
             },
         )
 
-    answers = submission.answers.all()
-
-    chosen_choices_ids = set(a.choice_id for a in answers if a.choice_id)
-    problem_correct_map = {
-        a.problem_id: a.choice.is_correct for a in answers if a.choice_id
-    }
-
-    problem_data = []
+    problems = get_submission_result(submission)
 
-    for problem in problems:
-        choices = [
-            {
-                "id": choice.id,
-                "body": choice.body,
-                "figure": choice.figure,
-                "is_correct": choice.is_correct,
-                "checked": choice.id in chosen_choices_ids,
-            }
-            for choice in problem.choices.all()
-        ]
-
-        problem_data.append({
-            "id": problem.id,
-            "body": problem.body,
-            "figure": problem.figure,
-            "choices": choices,
-            "answered_correctly": problem_correct_map.get(problem.id, False),
-        })
+    leaderboard = get_exam_leaderboard(submission.exam_id)
+    rank = percentile = None
+    if leaderboard:
+        rank, percentile = leaderboard.rank(submission.percentage)
 
     context = {
+        "rank": rank,
+        "percentile": percentile,
+        "submissions_count": leaderboard.submissions_count if leaderboard else None,
         "score": submission.score,
-        "wrong_answers": submission.wrong_answers,
+        "wrong_answers": len(problems) - submission.score,
         "percentage": submission.percentage,
         "exam_length": len(problems),
         "exam_title": submission.exam.title,
-        "problems": problem_data,
+        "problems": problems,
     }
 
     return render(
@@ -309,10 +327,11 @@ def exam_result(request, submission_id):
 @require_http_methods(["GET"])
 def create_custom_exam(request):
     """This view renders the create exam page, but does not handle the creation of the exam"""
+    version, _ = get_scope_bundle()
     context = {
-        "textbooks": Scope.objects.filter(is_published=True, level=0).prefetch_related(
-            "children__children__children"
-        ),
+        "textbooks": get_scope_tree().children(),
+        "difficulty_mixes": difficulty_mixes,
+        "bundle_url": f"{reverse('scope-tree-api')}?v={version}",
     }
     return render(request, "exam/create_exam.html", context)
 
@@ -326,3 +345,76 @@ def exam_list(request):
         "exam/exam_list.html",
         {"exams": get_exams(request=request, solved=solved)},
     )
+
+
+@login_required()
+@require_http_methods(["GET"])
+def exam_leaderboard(request, exam_id):
+    """returns the top submissions of the exam, it is served from the cache"""
+    exam = get_object_or_404(
+        Exam.objects.only("created_by", "is_published"), id=exam_id
+    )
+    if exam.created_by_id != request.user.id and not exam.is_published:
+        return JsonResponse({"message": "This exam is not accessible."}, status=403)
+
+    leaderboard = get_exam_leaderboard(exam_id)
+    return JsonResponse({
+        "submissions_count": leaderboard.submissions_count if leaderboard else 0,
+        "top": leaderboard.top if leaderboard else [],
+    })
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def export_answers(request):
+    """Streams the answers of completed submissions as CSV or JSON Lines.
+    It can be filtered by date range, exams, a scope subtree and users."""
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"Unknown export format: {export_format}")
+
+    try:
+        since = parse_export_date(request.GET.get("since"))
+        until = parse_export_date(request.GET.get("until"))
+        exam_ids = [int(exam_id) for exam_id in request.GET.getlist("exam")]
+        user_ids = [int(user_id) for user_id in request.GET.getlist("user")]
+        scope_id = int(request.GET.get("scope") or 0)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid export filters")
+
+    scope = get_object_or_404(Scope, id=scope_id) if scope_id else None
+
+    rows = export_rows(
+        since=since, until=until, exam_ids=exam_ids, scope=scope, user_ids=user_ids
+    )
+    return StreamingHttpResponse(
+        stream_export(rows, export_format),
+        content_type=EXPORT_FORMATS[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="answers.{export_format}"'
+        },
+    )
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def exam_analysis(request, exam_id):
+    """Shows the reliability and the item analysis of an exam to the staff"""
+    exam = get_object_or_404(Exam.objects.defer("payload"), id=exam_id)
+    return render(
+        request,
+        "exam/exam_analysis.html",
+        {"exam": exam, "analysis": analyze_exam(exam)},
+    )
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def exam_similarity(request, exam_id):
+    """Shows the pairs of submissions of an exam sharing many wrong choices to the staff"""
+    exam = get_object_or_404(Exam.objects.defer("payload"), id=exam_id)
+    return render(
+        request,
+        "exam/exam_similarity.html",
+        {"exam": exam, "similarity": find_similar_submissions(exam)},
+    )
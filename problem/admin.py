@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.db.models import Q
 
 from .models import Choice, Problem
+from .pools import invalidate_problem_pools
 
 
 class NestedChoiceInline(nested_admin.NestedTabularInline):
@@ -46,17 +47,48 @@ class ProblemListFilter(admin.SimpleListFilter):
 
 class ProblemAdmin(admin.ModelAdmin):
     inlines = [ChoiceInline]
-    list_display = ["body", "is_published"]
+    list_display = [
+        "body",
+        "is_published",
+        "difficulty",
+        "irt_difficulty",
+        "attempts",
+        "p_value",
+        "discrimination",
+    ]
+    list_select_related = ["stats"]
     list_filter = ["scope", "difficulty", "is_published", ProblemListFilter]
     search_fields = ["body"]
 
+    # item statistics are read from the problem stats row (see exam.ProblemStats)
+    @admin.display(description="Attempts")
+    def attempts(self, obj):
+        stats = getattr(obj, "stats", None)
+        return stats.attempts if stats else 0
+
+    @admin.display(description="P-value")
+    def p_value(self, obj):
+        stats = getattr(obj, "stats", None)
+        if stats and stats.p_value is not None:
+            return f"{stats.p_value:.2f}"
+        return "-"
+
+    @admin.display(description="Discrimination")
+    def discrimination(self, obj):
+        stats = getattr(obj, "stats", None)
+        if stats and stats.discrimination is not None:
+            return f"{stats.discrimination:.2f}"
+        return "-"
+
     @admin.action(description="Publish selected problems")
     def publish_problems(self, request, queryset):
         queryset.update(is_published=True)
+        invalidate_problem_pools()
 
     @admin.action(description="Unpublish selected problems")
     def unpublish_problems(self, request, queryset):
         queryset.update(is_published=False)
+        invalidate_problem_pools()
 
     actions = [publish_problems, unpublish_problems]
 
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProblemConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "problem"
+
+    def ready(self):
+        import problem.signals  # noqa: F401
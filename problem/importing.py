@@ -0,0 +1,398 @@
+import json
+import re
+from collections import Counter
+
+from django.db import transaction
+
+from exam.models import Exam
+from problem.models import Choice, Problem, content_hash
+from problem.pools import invalidate_problem_pools
+from scope.models import Scope
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+# what a number cut at the end of the buffer may have left after its digits
+_number_tail = re.compile(r"(\.\d*)?([eE][-+]?)?")
+_literals = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+
+
+def _truncated(buffer, error):
+    """returns whether a decoding error of the buffer can come from the buffer
+    ending in the middle of an element, so that reading more may fix it"""
+    tail = buffer[error.pos :]
+    if not tail.strip() or error.msg.startswith("Unterminated string"):
+        return True
+    if error.msg == "Expecting value":
+        return any(literal.startswith(tail) for literal in _literals)
+    if error.msg == "Expecting ',' delimiter":
+        return bool(_number_tail.fullmatch(tail))
+    if error.msg.startswith("Invalid \\uXXXX escape"):
+        return len(tail) <= len("uXXXX")
+    return False
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """Yields the elements of the top-level JSON array of a text file one by one,
+    reading it in chunks, so only about one element is in memory at a time.
+    Every element is parsed with the standard decoder, when it is not complete
+    yet more of the file is read and it is parsed again, reading at least as
+    much as is buffered so large elements are not parsed too many times.
+    An element is complete once what follows it is buffered, so a number cut
+    at the end of a chunk is not taken for a shorter one.
+    Raises json.JSONDecodeError on invalid JSON, with the position in the file,
+    as soon as the error is buffered."""
+    buffer = ""
+    position = 0  # in the buffer
+    offset = 0  # of the buffer in the file
+    eof = False
+    # what comes next: "[", the first element or "]", an element, or "," or "]"
+    state = "start"
+
+    while True:
+        position = _whitespace.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                raise json.JSONDecodeError("Unterminated array", "", offset + position)
+            buffer, offset, position = buffer[position:], offset + position, 0
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+
+        char = buffer[position]
+        if state == "start":
+            if char != "[":
+                raise json.JSONDecodeError("Expecting '['", "", offset + position)
+            state = "first"
+            position += 1
+        elif state == "delimiter":
+            if char == "]":
+                return
+            if char != ",":
+                raise json.JSONDecodeError(
+                    "Expecting ',' delimiter", "", offset + position
+                )
+            state = "element"
+            position += 1
+        elif state == "first" and char == "]":
+            return
+        else:
+            try:
+                element, end = _decoder.raw_decode(buffer, position)
+                # a number may go on in the next chunk, e.g. "1" of "1.5"
+                following = _whitespace.match(buffer, end).end()
+                complete = eof or (
+                    following < len(buffer)
+                    and (
+                        buffer[following] in ",]"
+                        or not _number_tail.fullmatch(buffer, end)
+                    )
+                )
+            except json.JSONDecodeError as e:
+                if eof or not _truncated(buffer, e):
+                    raise json.JSONDecodeError(e.msg, "", offset + e.pos) from None
+                complete = False
+            if not complete:
+                buffer, offset, position = buffer[position:], offset + position, 0
+                chunk = file.read(max(chunk_size, len(buffer)))
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield element
+            position = end
+            state = "delimiter"
+
+
+def iter_json_lines(file):
+    """Yields the JSON values of a JSON Lines text file, skipping blank lines.
+    Raises json.JSONDecodeError on invalid JSON, with the line number."""
+    for line_number, line in enumerate(file, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise json.JSONDecodeError(
+                    f"{e.msg} (line {line_number})", e.doc, e.pos
+                ) from None
+
+
+def lessons_by_title():
+    """returns a map of lesson title to id, with None for the titles
+    shared by more than one lesson"""
+    lessons = {}
+    for lesson_id, title in Scope.objects.filter(
+        level=Scope.LevelChoices.LESSON
+    ).values_list("id", "title"):
+        lessons[title] = None if title in lessons else lesson_id
+    return lessons
+
+
+class ProblemImporter:
+    """Imports topics of problems, a topic is a lesson title with its problems,
+    every problem has a body and a list of choices.
+    The lessons are read once up front, then the problems are buffered and
+    matched to the existing ones by content_hash one batch at a time, and each
+    batch is written with bulk statements in one transaction, so a failure only
+    loses the current batch.
+    Without `sync` the problems that already exist are skipped. With `sync`
+    they are updated from the file (body, lesson, published, and the choices
+    by position), unchanged ones are not written at all, and with
+    `unpublish_missing` the problems of the imported lessons that are not in
+    the file are unpublished by finish().
+    `counts` holds the created, updated, unchanged, duplicate, invalid and
+    unpublished problems, the created choices, and the skipped topics
+    (or problems of unknown topics)."""
+
+    def __init__(
+        self,
+        batch_size=1000,
+        dry_run=False,
+        warn=None,
+        sync=False,
+        unpublish_missing=False,
+    ):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.warn = warn or (lambda message: None)
+        self.sync = sync
+        self.unpublish_missing = unpublish_missing
+        self.lessons = lessons_by_title()
+        # content hashes of the problems of this import, and their lessons
+        self.hashes = set()
+        self.lesson_ids = set()
+        self.counts = Counter()
+        # existing problems whose correct choices changed
+        self.regraded_ids = []
+        self._batch = []
+        self._warned_titles = set()
+
+    def add_topic(self, topic):
+        if (
+            not isinstance(topic, dict)
+            or not all(key in topic for key in ["title", "problems"])
+            or not isinstance(topic["title"], str)
+        ):
+            title = topic.get("title", "Untitled") if isinstance(topic, dict) else ""
+            self.warn(f"Skipping invalid topic: {title}")
+            self.counts["skipped_topics"] += 1
+            return
+        lesson_id = self._lesson_id(topic["title"])
+        if lesson_id is None:
+            self.counts["skipped_topics"] += 1
+            return
+        for problem_data in topic["problems"]:
+            self.add_problem(lesson_id, problem_data)
+
+    def add_topic_problem(self, problem_data):
+        """adds one problem of a JSON Lines file, it has the title
+        of its lesson in "topic" besides its body and choices"""
+        if not isinstance(problem_data, dict) or not isinstance(
+            problem_data.get("topic"), str
+        ):
+            self.counts["invalid"] += 1
+            return
+        lesson_id = self._lesson_id(problem_data["topic"], warn_once=True)
+        if lesson_id is None:
+            self.counts["skipped_problems"] += 1
+            return
+        self.add_problem(lesson_id, problem_data)
+
+    def _lesson_id(self, title, warn_once=False):
+        lesson_id = self.lessons.get(title)
+        if lesson_id is None and title not in self._warned_titles:
+            if title not in self.lessons:
+                self.warn(f"Topic {title} not found. Skipping...")
+            else:
+                self.warn(f"Topic {title} matches more than one lesson. Skipping...")
+            if warn_once:
+                self._warned_titles.add(title)
+        return lesson_id
+
+    def add_problem(self, lesson_id, problem_data):
+        if (
+            not isinstance(problem_data, dict)
+            or not isinstance(problem_data.get("body"), str)
+            or not isinstance(problem_data.get("choices"), list)
+            or not all(isinstance(choice, dict) for choice in problem_data["choices"])
+        ):
+            self.counts["invalid"] += 1
+            return
+        digest = content_hash(problem_data["body"])
+        if digest in self.hashes:
+            self.counts["duplicates"] += 1
+            return
+        self.hashes.add(digest)
+        self.lesson_ids.add(lesson_id)
+
+        choices = [
+            (choice.get("body", ""), bool(choice.get("is_correct", False)))
+            for choice in problem_data["choices"]
+        ]
+        self._batch.append((digest, lesson_id, problem_data["body"], choices))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def _existing(self, hashes):
+        """returns the existing problems of the given hashes by hash, the oldest
+        one when several problems have the same hash. Without sync they are ids,
+        with sync they are (id, body, scope_id, is_published, choices) tuples
+        with the (id, body, is_correct) of the choices in order."""
+        problems = Problem.objects.filter(content_hash__in=hashes).order_by("-id")
+        if not self.sync:
+            return dict(problems.values_list("content_hash", "id"))
+        existing = {
+            digest: (problem_id, body, scope_id, is_published, [])
+            for digest, problem_id, body, scope_id, is_published in (
+                problems.values_list(
+                    "content_hash", "id", "body", "scope_id", "is_published"
+                )
+            )
+        }
+        choices = {problem[0]: problem[4] for problem in existing.values()}
+        for problem_id, choice_id, body, is_correct in (
+            Choice.objects.filter(problem_id__in=choices, is_archived=False)
+            .order_by("id")
+            .values_list("problem_id", "id", "body", "is_correct")
+        ):
+            choices[problem_id].append((choice_id, body or "", is_correct))
+        return existing
+
+    def _diff_choices(self, problem_id, existing, choices, changes):
+        """adds the changes of the choices of a problem, position by position,
+        to `changes`, and returns whether there are any"""
+        if [is_correct for *_, is_correct in existing] != [
+            is_correct for _, is_correct in choices
+        ]:
+            self.regraded_ids.append(problem_id)
+        changed = False
+        for (choice_id, *old), new in zip(existing, choices):
+            if tuple(old) != new:
+                body, is_correct = new
+                changes["updated"].append(
+                    Choice(id=choice_id, body=body, is_correct=is_correct)
+                )
+                changed = True
+        for body, is_correct in choices[len(existing) :]:
+            changes["created"].append(
+                Choice(problem_id=problem_id, body=body, is_correct=is_correct)
+            )
+            changed = True
+        for choice_id, *_ in existing[len(choices) :]:
+            changes["removed"].append(choice_id)
+            changed = True
+        return changed
+
+    def flush(self):
+        """matches the buffered problems to the existing ones and writes
+        the changes in one transaction"""
+        if not self._batch:
+            return
+        existing = self._existing([digest for digest, *_ in self._batch])
+        new_problems = []
+        updated_problems = []
+        updated_ids = []
+        choices = {"created": [], "updated": [], "removed": []}
+        for digest, lesson_id, body, problem_choices in self._batch:
+            problem = existing.get(digest)
+            if problem is None:
+                problem = Problem(
+                    scope_id=lesson_id,
+                    body=body,
+                    content_hash=digest,
+                    is_published=True,
+                )
+                new_problems.append(problem)
+                choices["created"].extend(
+                    Choice(problem=problem, body=choice_body, is_correct=is_correct)
+                    for choice_body, is_correct in problem_choices
+                )
+            elif not self.sync:
+                self.counts["duplicates"] += 1
+            else:
+                problem_id, old_body, old_scope_id, was_published, old_choices = problem
+                changed = self._diff_choices(
+                    problem_id, old_choices, problem_choices, choices
+                )
+                if (old_body, old_scope_id, was_published) != (body, lesson_id, True):
+                    updated_problems.append(
+                        Problem(
+                            id=problem_id,
+                            body=body,
+                            scope_id=lesson_id,
+                            is_published=True,
+                        )
+                    )
+                elif not changed:
+                    self.counts["unchanged"] += 1
+                    continue
+                updated_ids.append(problem_id)
+                self.counts["updated"] += 1
+
+        if not self.dry_run:
+            with transaction.atomic():
+                Problem.objects.bulk_create(new_problems)
+                Choice.objects.bulk_create(
+                    choices["created"], batch_size=self.batch_size
+                )
+                Problem.objects.bulk_update(
+                    updated_problems,
+                    ["body", "scope_id", "is_published"],
+                    batch_size=self.batch_size,
+                )
+                Choice.objects.bulk_update(
+                    choices["updated"],
+                    ["body", "is_correct"],
+                    batch_size=self.batch_size,
+                )
+                self._remove_choices(choices["removed"])
+                # bulk statements do not send the signals that clear the exams
+                # snapshots, and the exams must not grade with the old choices
+                if updated_ids:
+                    Exam.objects.filter(
+                        exam_problems__problem_id__in=updated_ids
+                    ).update(payload=None, answer_key=None)
+        self.counts["created"] += len(new_problems)
+        self.counts["choices"] += len(choices["created"])
+        self._batch = []
+
+    def _remove_choices(self, choice_ids):
+        """deletes the choices dropped from their problems, but the answered
+        ones are archived as wrong choices so that the answers are not deleted"""
+        if not choice_ids:
+            return
+        Choice.objects.filter(id__in=choice_ids, answer__isnull=True).delete()
+        self.counts["kept_choices"] += Choice.objects.filter(id__in=choice_ids).update(
+            is_correct=False, is_archived=True
+        )
+
+    def _unpublish_missing(self):
+        """unpublishes the published problems of the imported lessons
+        that were not in the import"""
+        missing = [
+            problem_id
+            for problem_id, digest in Problem.objects.filter(
+                scope_id__in=self.lesson_ids, is_published=True
+            )
+            .values_list("id", "content_hash")
+            .iterator(chunk_size=5000)
+            if digest not in self.hashes
+        ]
+        if not self.dry_run:
+            for start in range(0, len(missing), self.batch_size):
+                Problem.objects.filter(
+                    id__in=missing[start : start + self.batch_size]
+                ).update(is_published=False)
+        self.counts["unpublished"] += len(missing)
+
+    def finish(self):
+        """writes the last batch, it must be called once all topics are added"""
+        self.flush()
+        if self.sync and self.unpublish_missing:
+            self._unpublish_missing()
+        # bulk statements do not send the Problem signals
+        changed = (
+            self.counts["created"] + self.counts["updated"] + self.counts["unpublished"]
+        )
+        if changed and not self.dry_run:
+            invalidate_problem_pools()
+        return self.counts
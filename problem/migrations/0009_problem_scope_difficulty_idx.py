@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problem', '0008_alter_choice_figure'),
+        ('scope', '0012_scope_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['scope', 'difficulty', 'is_published'], name='problem_scope_difficulty_idx'),
+        ),
+    ]
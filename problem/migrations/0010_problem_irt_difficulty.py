@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problem', '0009_problem_scope_difficulty_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='irt_difficulty',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
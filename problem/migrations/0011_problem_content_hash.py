@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:05
+
+import hashlib
+import unicodedata
+
+from django.db import migrations, models
+
+
+def content_hash(body):
+    """problem.models.content_hash as of this migration, it is copied so that
+    later changes of the normalization do not change this backfill"""
+    normalized = " ".join(unicodedata.normalize("NFKC", body).casefold().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
+def hash_problem_bodies(apps, schema_editor):
+    Problem = apps.get_model("problem", "Problem")
+
+    problems = []
+    for problem in Problem.objects.only("id", "body").iterator(chunk_size=2000):
+        problem.content_hash = content_hash(problem.body)
+        problems.append(problem)
+        if len(problems) == 2000:
+            Problem.objects.bulk_update(problems, ["content_hash"])
+            problems = []
+    Problem.objects.bulk_update(problems, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("problem", "0010_problem_irt_difficulty"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="problem",
+            name="content_hash",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=32
+            ),
+        ),
+        migrations.RunPython(hash_problem_bodies, migrations.RunPython.noop),
+    ]
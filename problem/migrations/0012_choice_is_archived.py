@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problem', '0011_problem_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='is_archived',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -1,9 +1,19 @@
+import hashlib
+import unicodedata
+
 from django.core.validators import FileExtensionValidator
 from django.db import models
 
 from scope.models import Scope
 
 
+def content_hash(body):
+    """returns the hex digest of a problem body normalized for comparison,
+    ignoring the unicode form, the letter case and the whitespace"""
+    normalized = " ".join(unicodedata.normalize("NFKC", body).casefold().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
 class Problem(models.Model):
     """This model represents the problems of a lesson"""
 
@@ -32,9 +42,28 @@ class Problem(models.Model):
         choices=Difficulty, default=Difficulty.EASY
     )
     is_published = models.BooleanField(default=False)
+    # Rasch difficulty in logits, set by the calibrate_problems command
+    irt_difficulty = models.FloatField(null=True, blank=True, editable=False)
+    # content_hash of the body, it matches imported problems to the existing ones
+    content_hash = models.CharField(
+        max_length=32, editable=False, db_index=True, default=""
+    )
 
     class Meta:
         ordering = ["difficulty", "created_at"]
+        indexes = [
+            models.Index(
+                fields=["scope", "difficulty", "is_published"],
+                name="problem_scope_difficulty_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.content_hash = content_hash(self.body)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "body" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "content_hash"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.body[:24]
@@ -57,6 +86,9 @@ class Choice(models.Model):
         validators=[FileExtensionValidator(allowed_extensions=["svg", "png", "jpg"])],
     )
     is_correct = models.BooleanField(default=False)
+    # removed from its problem by an import but kept for its answers,
+    # it is not shown in the new exams
+    is_archived = models.BooleanField(default=False, editable=False)
 
     def __str__(self):
         return self.body or self.figure.name
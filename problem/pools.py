@@ -0,0 +1,82 @@
+import time
+from array import array
+
+from django.core.cache import cache
+
+from problem.models import Problem
+
+POOL_VERSION_KEY = "problem_pools:version"
+POOL_TIMEOUT = 60 * 60 * 24
+
+# process-local copy of the pools of the current version, a (version, pools)
+# pair that is replaced as a whole so threads never mix two versions
+_local_pools = (None, {})
+
+
+def get_pools_version():
+    """returns the current pools version, all workers share it through the cache"""
+    version = cache.get(POOL_VERSION_KEY)
+    if version is None:
+        cache.add(POOL_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(POOL_VERSION_KEY)
+    return version
+
+
+def invalidate_problem_pools():
+    """Drops every cached pool, it should be called whenever published problems
+    change in a way that bypasses the Problem signals (e.g. queryset.update)"""
+    cache.set(POOL_VERSION_KEY, time.time_ns(), None)
+
+
+def _load_pool(scope):
+    """returns a map of difficulty to the sorted array of the published problem ids
+    of that difficulty under the scope"""
+    pool = {difficulty: array("I") for difficulty in Problem.Difficulty.values}
+    problems = (
+        Problem.objects.filter(scope.subtree_q("scope__"), is_published=True)
+        .order_by("difficulty", "id")
+        .values_list("difficulty", "id")
+    )
+    for difficulty, problem_id in problems:
+        pool[difficulty].append(problem_id)
+    return pool
+
+
+def get_problem_pools(scopes) -> dict[int, dict[int, array]]:
+    """returns a map of scope id to its pool, the published problem ids under it
+    split by difficulty (see _load_pool).
+    Pools are looked up in the process first, then in the shared cache,
+    and only the missing ones are loaded from the database."""
+    global _local_pools
+    version = get_pools_version()
+    local_version, local = _local_pools
+    if local_version != version:
+        local = {}
+        _local_pools = (version, local)
+
+    pools = {scope.id: local[scope.id] for scope in scopes if scope.id in local}
+    missing = {
+        f"problem_pool:{version}:{scope.id}": scope
+        for scope in scopes
+        if scope.id not in pools
+    }
+    if not missing:
+        return pools
+
+    shared = cache.get_many(missing.keys())
+    to_cache = {}
+    for key, scope in missing.items():
+        if key in shared:
+            pool = {}
+            for difficulty, ids in shared[key].items():
+                pool[difficulty] = array("I")
+                pool[difficulty].frombytes(ids)
+        else:
+            pool = _load_pool(scope)
+            to_cache[key] = {
+                difficulty: ids.tobytes() for difficulty, ids in pool.items()
+            }
+        pools[scope.id] = local[scope.id] = pool
+    if to_cache:
+        cache.set_many(to_cache, POOL_TIMEOUT)
+    return pools
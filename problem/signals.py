@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from scope.models import Scope
+
+from .models import Problem
+from .pools import invalidate_problem_pools
+
+
+@receiver(post_save, sender=Problem)
+@receiver(post_delete, sender=Problem)
+@receiver(post_save, sender=Scope)
+@receiver(post_delete, sender=Scope)
+def clear_problem_pools(sender, instance, **kwargs):
+    # after the commit, so no request rebuilds the new version from old rows,
+    # and the paths of a re-parented scope subtree are already rewritten
+    transaction.on_commit(invalidate_problem_pools)
@@ -1 +1,247 @@
-# Create your tests here.
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from exam.models import Answer, Exam, ExamProblem, Submission
+from exam.service import build_exam_payload
+from problem.importing import ProblemImporter, iter_json_array
+from problem.models import Choice, Problem
+from problem.pools import get_problem_pools, invalidate_problem_pools
+from scope.models import Scope
+
+
+class ProblemImporterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lesson = Scope.objects.create(
+            title="Waves", level=Scope.LevelChoices.LESSON
+        )
+        Problem.objects.create(scope=cls.lesson, body="Existing")
+
+    def test_import_skips_duplicates_and_unknown_topics(self):
+        choices = [{"body": "A", "is_correct": True}, {"body": "B"}]
+        importer = ProblemImporter(batch_size=2)
+        importer.add_topic(
+            {
+                "title": "Waves",
+                "problems": [
+                    {"body": "Existing", "choices": choices},
+                    {"body": "First", "choices": choices},
+                    {"body": "First", "choices": choices},
+                    {"body": "Second", "choices": choices},
+                    {"body": "Third", "choices": choices},
+                    {"body": "No choices"},
+                ],
+            }
+        )
+        importer.add_topic({"title": "Unknown", "problems": []})
+        counts = importer.finish()
+
+        self.assertEqual(counts["created"], 3)
+        self.assertEqual(counts["duplicates"], 2)
+        self.assertEqual(counts["invalid"], 1)
+        self.assertEqual(counts["skipped_topics"], 1)
+        self.assertEqual(Problem.objects.filter(scope=self.lesson).count(), 4)
+        self.assertEqual(
+            Choice.objects.filter(problem__body="Third", is_correct=True).count(), 1
+        )
+
+    def test_dry_run_writes_nothing(self):
+        importer = ProblemImporter(dry_run=True)
+        importer.add_topic(
+            {
+                "title": "Waves",
+                "problems": [{"body": "New", "choices": [{"body": "A"}]}],
+            }
+        )
+        self.assertEqual(importer.finish()["created"], 1)
+        self.assertEqual(Problem.objects.count(), 1)
+
+    def test_sync_updates_changed_problems_only(self):
+        problem = Problem.objects.get(body="Existing")
+        Choice.objects.create(problem=problem, body="A", is_correct=True)
+        Choice.objects.create(problem=problem, body="B")
+        Problem.objects.create(scope=self.lesson, body="Removed", is_published=True)
+        Problem.objects.create(scope=self.lesson, body="Kept", is_published=True)
+        kept_choice = Choice.objects.create(
+            problem=Problem.objects.get(body="Kept"), body="A"
+        )
+
+        importer = ProblemImporter(sync=True, unpublish_missing=True)
+        importer.add_topic(
+            {
+                "title": "Waves",
+                "problems": [
+                    {
+                        "body": "existing ",
+                        "choices": [{"body": "A"}, {"body": "B", "is_correct": True}],
+                    },
+                    {"body": "Kept", "choices": [{"body": "A"}]},
+                ],
+            }
+        )
+        exam = Exam.objects.create(
+            title="Exam", created_by=User.objects.create_user("teacher")
+        )
+        ExamProblem.objects.create(exam=exam, problem=problem, order=1)
+        Exam.objects.filter(pk=exam.pk).update(payload=[], answer_key=[])
+
+        # the problems and their choices, then one UPDATE of each
+        # and of the exams snapshots in a savepoint
+        with self.assertNumQueries(7):
+            importer.flush()
+        counts = importer.finish()
+
+        self.assertEqual(counts["updated"], 1)
+        self.assertEqual(counts["unchanged"], 1)
+        self.assertEqual(counts["unpublished"], 1)
+        self.assertEqual(importer.regraded_ids, [problem.id])
+        problem.refresh_from_db()
+        self.assertEqual(problem.body, "existing ")
+        self.assertTrue(problem.is_published)
+        self.assertEqual(
+            list(problem.choices.order_by("id").values_list("body", "is_correct")),
+            [("A", False), ("B", True)],
+        )
+        self.assertFalse(Problem.objects.get(body="Removed").is_published)
+        exam.refresh_from_db()
+        self.assertIsNone(exam.answer_key)
+        kept_choice.refresh_from_db()
+        self.assertEqual(kept_choice.body, "A")
+
+    def test_sync_archives_answered_removed_choices(self):
+        problem = Problem.objects.get(body="Existing")
+        Choice.objects.create(problem=problem, body="A", is_correct=True)
+        answered = Choice.objects.create(problem=problem, body="B")
+        Choice.objects.create(problem=problem, body="C")
+        teacher = User.objects.create_user("teacher")
+        exam = Exam.objects.create(title="Exam", created_by=teacher)
+        ExamProblem.objects.create(exam=exam, problem=problem, order=1)
+        submission = Submission.objects.create(exam=exam, user=teacher)
+        Answer.objects.create(problem=problem, submission=submission, choice=answered)
+
+        importer = ProblemImporter(sync=True)
+        importer.add_topic(
+            {
+                "title": "Waves",
+                "problems": [
+                    {"body": "Existing", "choices": [{"body": "A", "is_correct": True}]}
+                ],
+            }
+        )
+        self.assertEqual(importer.finish()["kept_choices"], 1)
+
+        answered.refresh_from_db()
+        self.assertTrue(answered.is_archived)
+        self.assertFalse(answered.is_correct)
+        self.assertEqual(problem.choices.count(), 2)
+        [payload] = build_exam_payload(exam)
+        self.assertEqual([choice["body"] for choice in payload["choices"]], ["A"])
+
+        # the archived choice is no longer part of the problem choices
+        importer = ProblemImporter(sync=True)
+        importer.add_topic(
+            {
+                "title": "Waves",
+                "problems": [
+                    {"body": "Existing", "choices": [{"body": "A", "is_correct": True}]}
+                ],
+            }
+        )
+        counts = importer.finish()
+        self.assertEqual(counts["unchanged"], 1)
+        self.assertEqual(counts["kept_choices"], 0)
+
+
+class ProblemPoolsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.textbook = Scope.objects.create(title="Physics")
+        cls.lesson = Scope.objects.create(
+            title="Waves", level=Scope.LevelChoices.LESSON, parent=cls.textbook
+        )
+        cls.problem = Problem.objects.create(
+            scope=cls.lesson, body="Published", is_published=True
+        )
+
+    def setUp(self):
+        invalidate_problem_pools()
+
+    def pool_ids(self, scope):
+        pool = get_problem_pools([scope])[scope.id]
+        return sorted(problem_id for ids in pool.values() for problem_id in ids)
+
+    def test_publishing_invalidates_the_pools_on_commit(self):
+        self.assertEqual(self.pool_ids(self.textbook), [self.problem.id])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            draft = Problem.objects.create(scope=self.lesson, body="Draft")
+            draft.is_published = True
+            draft.save()
+            # still the pools of the last committed version
+            self.assertEqual(self.pool_ids(self.textbook), [self.problem.id])
+        self.assertTrue(callbacks)
+        self.assertEqual(
+            self.pool_ids(self.textbook), sorted([self.problem.id, draft.id])
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.problem.is_published = False
+            self.problem.save()
+        self.assertEqual(self.pool_ids(self.lesson), [draft.id])
+        self.assertEqual(self.pool_ids(self.textbook), [draft.id])
+
+    def test_pools_are_read_once_per_version(self):
+        self.pool_ids(self.lesson)
+        with self.assertNumQueries(0):
+            self.pool_ids(self.lesson)
+
+
+class IterJsonArrayTests(SimpleTestCase):
+    def test_elements_split_across_chunks(self):
+        text = '[ {"title": "a ] , b", "problems": [1, 2]}, 12345, "x", [], null ]'
+        for chunk_size in (1, 3, 1 << 16):
+            self.assertEqual(
+                list(iter_json_array(io.StringIO(text), chunk_size)), json.loads(text)
+            )
+        self.assertEqual(list(iter_json_array(io.StringIO(" [ ] "))), [])
+
+    def test_numbers_cut_at_chunk_ends(self):
+        text = '[-25000000000.0, 1.5e-07, 12, 1E+2, -0.5, "\\u00e9", true]'
+        for chunk_size in range(1, len(text) + 1):
+            self.assertEqual(
+                list(iter_json_array(io.StringIO(text), chunk_size)), json.loads(text)
+            )
+
+    def test_invalid_json(self):
+        for text in [
+            "",
+            "{}",
+            "[1, 2",
+            "[1 2]",
+            "[1,]",
+            '[{"a": }]',
+            "[1.]",
+            "[1.5e]",
+            "[tru]",
+            '["\\u12x4"]',
+        ]:
+            with self.assertRaises(json.JSONDecodeError):
+                list(iter_json_array(io.StringIO(text), 2))
+
+    def test_invalid_json_raises_before_the_end(self):
+        class File(io.StringIO):
+            read_size = 0
+
+            def read(self, size=-1):
+                chunk = super().read(size)
+                self.read_size += len(chunk)
+                return chunk
+
+        for error in ["[1, 2 x", '[{"a": 1 "b"}', "[1, tr ", '["a", "b\n"']:
+            file = File(error + ", 3" * 100_000 + "]")
+            with self.assertRaises(json.JSONDecodeError) as raised:
+                list(iter_json_array(file, 16))
+            self.assertLess(raised.exception.pos, len(error))
+            self.assertLess(file.read_size, 100)
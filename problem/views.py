@@ -3,7 +3,7 @@ from django.shortcuts import get_object_or_404, redirect, render
 
 from problem.models import Problem
 from scope.models import Scope
-from scope.views import _get_breadcrumbs
+from scope.tree import get_scope_tree
 
 
 @login_required()
@@ -21,8 +21,9 @@ def scope_problem_list(request, slug):
         return redirect("dashboard")
     scope = get_object_or_404(Scope, slug=slug)
     problems = scope.problems
+    breadcrumbs = get_scope_tree().ancestors(scope.id)
     return render(
         request,
         "problem/problem_list.html",
-        {"problems": problems, "scope": scope, "breadcrumbs": _get_breadcrumbs(scope)},
+        {"problems": problems, "scope": scope, "breadcrumbs": breadcrumbs},
     )
@@ -4,8 +4,10 @@ from django.contrib.admin import SimpleListFilter
 from django.utils.translation import gettext_lazy as _
 
 from problem.admin import ProblemInline
+from problem.pools import invalidate_problem_pools
 
 from .models import Scope
+from .tree import invalidate_scope_tree
 
 
 class ParentFilter(SimpleListFilter):
@@ -40,6 +42,8 @@ class ScopeAdmin(nested_admin.NestedModelAdmin):
     @admin.action(description="Publish selected scopes")
     def publish(self, request, queryset):
         queryset.update(is_published=True)
+        invalidate_problem_pools()
+        invalidate_scope_tree()
         if queryset.filter(is_published=True).exists():
             messages.success(request, "Selected scopes published successfully")
         else:
@@ -52,6 +56,8 @@ class ScopeAdmin(nested_admin.NestedModelAdmin):
             if scope.children.exists():
                 scope.children.update(is_published=False)
                 self.unpublish(request, scope.children.all())
+        invalidate_problem_pools()
+        invalidate_scope_tree()
         messages.success(request, "Selected scopes unpublished successfully")
 
     actions = [publish, unpublish]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ScopeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "scope"
+
+    def ready(self):
+        import scope.signals  # noqa: F401
@@ -0,0 +1,180 @@
+from collections import defaultdict, deque
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from scope.models import Scope
+from scope.tree import invalidate_scope_tree
+
+TITLE_MAX_LENGTH = Scope._meta.get_field("title").max_length
+
+
+class CurriculumError(Exception):
+    """Raised with all the problems found in a curriculum, before writing anything"""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} errors in the curriculum")
+        self.errors = errors
+
+
+class CurriculumNode:
+    """One scope of a curriculum file, `scope` is set once it is in the database.
+    caption and is_published are None when the file does not set them."""
+
+    __slots__ = ["title", "caption", "is_published", "parent", "scope"]
+
+    def __init__(self, title, caption, is_published, parent):
+        self.title = title
+        self.caption = caption
+        self.is_published = is_published
+        self.parent = parent
+        self.scope = None
+
+
+def parse_curriculum(data) -> list[list[CurriculumNode]]:
+    """Validates a curriculum in one pass and returns its nodes level by level,
+    from the textbooks down to the lessons, every level in file order.
+    A curriculum is a list of textbooks, and every scope is an object with a
+    title, an optional caption, an optional is_published and optional children
+    (units of a textbook, chapters of a unit, lessons of a chapter).
+    Raises CurriculumError with every problem found."""
+    levels = [[] for _ in Scope.LevelChoices]
+    errors = []
+    if not isinstance(data, list):
+        raise CurriculumError(["The curriculum should be a list of textbooks"])
+
+    # (items, parent node, level, location of the parent)
+    pending = deque([(data, None, 0, "")])
+    while pending:
+        items, parent, level, location = pending.popleft()
+        titles = set()
+        for index, item in enumerate(items, 1):
+            item_location = f"{location} > [{index}]" if location else f"[{index}]"
+            if not isinstance(item, dict):
+                errors.append(f"{item_location}: should be an object")
+                continue
+            title = item.get("title")
+            caption = item.get("caption")
+            is_published = item.get("is_published")
+            children = item.get("children", [])
+            if not isinstance(title, str) or not title.strip():
+                errors.append(f"{item_location}: the title is required")
+                continue
+            title = title.strip()
+            item_location = f"{location} > {title}" if location else title
+            if len(title) > TITLE_MAX_LENGTH:
+                errors.append(
+                    f"{item_location}: the title is longer than {TITLE_MAX_LENGTH}"
+                )
+            if title in titles:
+                errors.append(f"{item_location}: the title is repeated")
+            titles.add(title)
+            if caption is not None and not isinstance(caption, str):
+                errors.append(f"{item_location}: the caption should be a string")
+            if is_published is not None and not isinstance(is_published, bool):
+                errors.append(f"{item_location}: is_published should be a boolean")
+            if not isinstance(children, list):
+                errors.append(f"{item_location}: the children should be a list")
+                continue
+            if children and level == Scope.LevelChoices.LESSON:
+                errors.append(f"{item_location}: lessons can not have children")
+                continue
+
+            node = CurriculumNode(title, caption, is_published, parent)
+            levels[level].append(node)
+            if children:
+                pending.append((children, node, level + 1, item_location))
+
+    if errors:
+        raise CurriculumError(errors)
+    return levels
+
+
+class _SlugAllocator:
+    """Allocates unique slugs like Scope.save, against one fetch of the slugs"""
+
+    def __init__(self):
+        self.slugs = set(Scope.objects.values_list("slug", flat=True))
+        self.counters = defaultdict(int)
+
+    def allocate(self, level, title):
+        base_slug = slugify(f"{Scope.LevelChoices(level).label} {title}")
+        slug = base_slug
+        while slug in self.slugs:
+            self.counters[base_slug] += 1
+            slug = f"{base_slug}-{self.counters[base_slug]}"
+        self.slugs.add(slug)
+        return slug
+
+
+def import_curriculum(levels, update=False, batch_size=1000):
+    """Writes the nodes returned by parse_curriculum to the database, level by
+    level with bulk_create, so the queries do not grow with the number of scopes.
+    Scopes are matched to the existing ones by (parent, title). The existing
+    scopes are kept as they are, or with `update` their caption and is_published
+    are set from the file. New scopes are appended after their existing siblings.
+    Returns the numbers of created, updated and unchanged scopes."""
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    existing = {
+        (scope.parent_id, scope.title): scope
+        for scope in Scope.objects.only(
+            "id", "parent_id", "title", "caption", "is_published", "path"
+        )
+    }
+    last_orders = defaultdict(int)
+    for parent_id, order in Scope.objects.filter(parent__isnull=False).values_list(
+        "parent_id", "in_scope_order"
+    ):
+        last_orders[parent_id] = max(last_orders[parent_id], order)
+    slugs = _SlugAllocator()
+
+    with transaction.atomic():
+        for level, nodes in enumerate(levels):
+            created = []
+            updated = []
+            for node in nodes:
+                parent_id = node.parent.scope.id if node.parent else None
+                scope = existing.get((parent_id, node.title))
+                if scope is None:
+                    order = 0
+                    if parent_id is not None:
+                        order = last_orders[parent_id] = last_orders[parent_id] + 1
+                    scope = Scope(
+                        title=node.title,
+                        caption=node.caption or "",
+                        is_published=bool(node.is_published),
+                        parent_id=parent_id,
+                        level=level,
+                        in_scope_order=order,
+                        slug=slugs.allocate(level, node.title),
+                    )
+                    created.append(scope)
+                elif update and (
+                    node.caption not in (None, scope.caption)
+                    or node.is_published not in (None, scope.is_published)
+                ):
+                    if node.caption is not None:
+                        scope.caption = node.caption
+                    if node.is_published is not None:
+                        scope.is_published = node.is_published
+                    updated.append(scope)
+                else:
+                    counts["unchanged"] += 1
+                node.scope = scope
+
+            Scope.objects.bulk_create(created, batch_size=batch_size)
+            # the paths need the new ids, so they are written in a second pass
+            for node in nodes:
+                if not node.scope.path:
+                    parent_path = node.parent.scope.path if node.parent else ""
+                    node.scope.path = f"{parent_path}{node.scope.id}/"
+            Scope.objects.bulk_update(created, ["path"], batch_size=batch_size)
+            Scope.objects.bulk_update(
+                updated, ["caption", "is_published"], batch_size=batch_size
+            )
+            counts["created"] += len(created)
+            counts["updated"] += len(updated)
+
+        # bulk_create and bulk_update do not send the Scope signals
+        transaction.on_commit(invalidate_scope_tree)
+    return counts
@@ -0,0 +1,80 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scope.curriculum import CurriculumError, import_curriculum, parse_curriculum
+from scope.models import Scope
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a curriculum, a tree of textbooks, units, chapters and lessons, "
+        "from a JSON (or YAML, with PyYAML installed) file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", type=str, help="Path to the curriculum file")
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help="Update the caption and is_published of the existing scopes",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of scopes inserted per query",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only validate the file",
+        )
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            raise CommandError(f"File {path} does not exist")
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                try:
+                    import yaml
+                except ImportError:
+                    raise CommandError("PyYAML is required to import YAML files")
+                try:
+                    return yaml.safe_load(f)
+                except yaml.YAMLError as e:
+                    raise CommandError(f"Error parsing YAML file: {e}")
+            try:
+                return json.load(f)
+            except json.JSONDecodeError as e:
+                raise CommandError(f"Error parsing JSON file: {e}")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        data = self._load(options["file"])
+        try:
+            levels = parse_curriculum(data)
+        except CurriculumError as e:
+            for error in e.errors:
+                self.stderr.write(self.style.ERROR(error))
+            raise CommandError(str(e))
+        self.stdout.write(
+            "Validated "
+            + ", ".join(
+                f"{len(nodes)} {level.label.lower()}s"
+                for level, nodes in zip(Scope.LevelChoices, levels)
+            )
+        )
+        if options["dry_run"]:
+            return
+
+        counts = import_curriculum(levels, options["update"], options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {counts['created']}, updated {counts['updated']} "
+                f"and kept {counts['unchanged']} scopes "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
@@ -1,20 +1,51 @@
 import json
 import os
+import time
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
 
-from problem.models import Choice, Problem
-from scope.models import Scope
+from problem.importing import ProblemImporter, iter_json_array, iter_json_lines
 
 
 class Command(BaseCommand):
-    help = "Import science questions from a JSON file into the database"
+    help = (
+        "Import science questions from a JSON file into the database, "
+        "or from a JSON Lines (.jsonl) file of problems with their topic"
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
             "json_file", type=str, help="Path to the JSON file to import"
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of problems inserted per transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be imported without writing anything",
+        )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="Update the existing problems and their choices from the file "
+            "instead of skipping them",
+        )
+        parser.add_argument(
+            "--unpublish-missing",
+            action="store_true",
+            help="With --sync, unpublish the problems of the imported lessons "
+            "that are not in the file",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Parse the topics one by one instead of loading the whole file, "
+            "JSON Lines files are always streamed",
+        )
 
     def handle(self, *args, **options):
         json_file = options["json_file"]
@@ -22,79 +53,90 @@ class Command(BaseCommand):
         if not os.path.exists(json_file):
             self.stderr.write(self.style.ERROR(f"File {json_file} does not exist"))
             return
+        if options["unpublish_missing"] and not options["sync"]:
+            self.stderr.write(self.style.ERROR("--unpublish-missing needs --sync"))
+            return
 
+        start = time.perf_counter()
+        importer = ProblemImporter(
+            options["batch_size"],
+            options["dry_run"],
+            lambda message: self.stderr.write(self.style.WARNING(message)),
+            options["sync"],
+            options["unpublish_missing"],
+        )
         try:
             with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
+                if json_file.endswith(".jsonl"):
+                    for problem_data in iter_json_lines(f):
+                        importer.add_topic_problem(problem_data)
+                elif options["stream"]:
+                    for topic_data in iter_json_array(f):
+                        importer.add_topic(topic_data)
+                else:
+                    data = json.load(f)
+                    if not isinstance(data, list):
+                        self.stderr.write(
+                            self.style.ERROR(
+                                "JSON file should contain an array of topics"
+                            )
+                        )
+                        return
+                    for topic_data in data:
+                        importer.add_topic(topic_data)
         except json.JSONDecodeError as e:
-            self.stderr.write(self.style.ERROR(f"Error parsing JSON file: {e}"))
-            return
-
-        if not isinstance(data, list):
+            # the batches before the error are already committed
+            importer.finish()
             self.stderr.write(
-                self.style.ERROR("JSON file should contain an array of topics")
+                self.style.ERROR(
+                    f"Error parsing JSON file: {e}, "
+                    f"{importer.counts['created']} problems were imported"
+                )
             )
             return
+        counts = importer.finish()
+        elapsed = time.perf_counter() - start
 
-        with transaction.atomic():
-            for topic_data in data:
-                if not all(key in topic_data for key in ["title", "problems"]):
-                    self.stderr.write(
-                        self.style.WARNING(
-                            f"Skipping invalid topic: {topic_data.get('title', 'Untitled')}"
-                        )
-                    )
-                    continue
-
-                # Create topic scope
-                topic_title = topic_data["title"]
-                self.stdout.write(
-                    self.style.SUCCESS(f"Processing topic: {topic_title}")
+        if counts["duplicates"]:
+            self.stderr.write(
+                self.style.WARNING(f"Skipped {counts['duplicates']} duplicate problems")
+            )
+        if counts["invalid"]:
+            self.stderr.write(
+                self.style.WARNING(f"Skipped {counts['invalid']} invalid problems")
+            )
+        if counts["skipped_problems"]:
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Skipped {counts['skipped_problems']} problems of unknown topics"
                 )
-
-                try:
-                    topic_scope = Scope.objects.get(
-                        title=topic_title,
-                        level=Scope.LevelChoices.LESSON,
-                    )
-
-                    # Process problems
-                    for problem_data in topic_data.get("problems", []):
-                        if "body" not in problem_data or "choices" not in problem_data:
-                            self.stderr.write(
-                                self.style.WARNING("Skipping invalid problem")
-                            )
-                            continue
-
-                        # Create problem
-                        if Problem.objects.filter(body=problem_data["body"]).exists():
-                            self.stderr.write(
-                                self.style.WARNING("Skipping duplicate problem")
-                            )
-                            continue
-                        problem = Problem.objects.create(
-                            scope=topic_scope,
-                            body=problem_data["body"],
-                            is_published=True,
-                        )
-
-                        # Create choices
-                        for choice_data in problem_data.get("choices", []):
-                            Choice.objects.create(
-                                problem=problem,
-                                body=choice_data.get("body", ""),
-                                is_correct=choice_data.get("is_correct", False),
-                            )
-
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f"  - Added problem: {problem.body[:50]}..."
-                            )
-                        )
-                except Scope.DoesNotExist:
-                    self.stderr.write(
-                        self.style.ERROR(f"Topic {topic_title} not found. Skipping...")
-                    )
-                    continue
-
-        self.stdout.write(self.style.SUCCESS("Successfully imported all data"))
+            )
+        action = "Would import" if options["dry_run"] else "Imported"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action} {counts['created']} problems and {counts['choices']} "
+                f"choices in {elapsed:.2f}s "
+                f"({counts['created'] / max(elapsed, 1e-9):.0f} problems/s)"
+            )
+        )
+        if options["sync"]:
+            self.stdout.write(
+                f"Updated {counts['updated']}, unpublished {counts['unpublished']} "
+                f"and kept {counts['unchanged']} unchanged problems"
+            )
+        if counts["kept_choices"]:
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Archived {counts['kept_choices']} removed choices as wrong choices "
+                    "because they were answered"
+                )
+            )
+        if importer.regraded_ids and not options["dry_run"]:
+            problem_ids = " ".join(map(str, importer.regraded_ids))
+            self.stderr.write(
+                self.style.WARNING(
+                    f"The correct choices of {len(importer.regraded_ids)} problems "
+                    "changed, update the past submissions with: "
+                    f"manage.py regrade_submissions --problem {problem_ids}"
+                )
+            )
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:23
+
+from django.db import migrations, models
+
+
+def build_scope_paths(apps, schema_editor):
+    Scope = apps.get_model("scope", "Scope")
+
+    paths = {}
+    scopes = []
+    level = Scope.objects.filter(parent__isnull=True)
+    while level:
+        for scope in level:
+            scope.path = f"{paths.get(scope.parent_id, '')}{scope.pk}/"
+            paths[scope.pk] = scope.path
+            scopes.append(scope)
+        level = list(Scope.objects.filter(parent_id__in=[s.pk for s in level]))
+    Scope.objects.bulk_update(scopes, ["path"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scope', '0011_alter_scope_level'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scope',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_scope_paths, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Concat, Substr
 from django.urls import reverse
 from django.utils.text import slugify
 
@@ -37,6 +38,9 @@ class Scope(models.Model):
         choices=LevelChoices, default=LevelChoices.TEXTBOOK
     )
     is_published = models.BooleanField(default=False)
+    # materialized path of ancestor ids ending with this scope's id, e.g. "1/5/12/"
+    # it lets the whole subtree of a scope be fetched with one prefix lookup
+    path = models.CharField(max_length=255, editable=False, db_index=True, default="")
 
     class Meta:
         ordering = ["in_scope_order"]
@@ -52,16 +56,13 @@ class Scope(models.Model):
         ]
 
     def clean(self) -> None:
-        """Custom validation to prevent circular references"""
+        """Custom validation to prevent circular references,
+        the new parent must not be in the subtree of this scope,
+        so this scope must not be on the path of the parent"""
         super().clean()
-        if self.parent:
-            current = self.parent
-            visited = set()
-            while current:
-                if current.pk == self.pk:
-                    raise ValidationError("A scope can not be its own parent.")
-                visited.add(current.pk)
-                current = current.parent
+        if self.parent and self.pk:
+            if str(self.pk) in self.parent.path.split("/") or self.parent.pk == self.pk:
+                raise ValidationError("A scope can not be its own parent.")
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -77,7 +78,23 @@ class Scope(models.Model):
                 counter += 1
 
         self.full_clean()
-        super().save()
+        with transaction.atomic():
+            super().save()
+            self._update_path()
+
+    def _update_path(self):
+        """Keeps the materialized path of this scope and its subtree up to date"""
+        path = f"{self.parent.path if self.parent else ''}{self.pk}/"
+        if path == self.path:
+            return
+        old_path, self.path = self.path, path
+        if old_path:
+            # re-parented, so rewrite the prefix of the whole subtree at once
+            Scope.objects.filter(path__startswith=old_path).update(
+                path=Concat(models.Value(path), Substr("path", len(old_path) + 1))
+            )
+        else:
+            Scope.objects.filter(pk=self.pk).update(path=path)
 
     def __str__(self):
         return f"{self.type}: {self.title}"
@@ -98,10 +115,15 @@ class Scope(models.Model):
         """returns all the probelms under this scope"""
         from problem.models import Problem
 
-        return Problem.objects.filter(
-            models.Q(scope=self)
-            | models.Q(scope__parent=self)
-            | models.Q(scope__parent__parent=self)
-            | models.Q(scope__parent__parent__parent=self),
-            is_published=True,
+        return Problem.objects.filter(self.subtree_q("scope__"), is_published=True)
+
+    def subtree_q(self, prefix=""):
+        """returns a Q object matching this scope and all of its descendants.
+        It is a range over the path index ("/" sorts right before "0"),
+        which unlike startswith can use the index on every database backend."""
+        return models.Q(
+            **{
+                f"{prefix}path__gte": self.path,
+                f"{prefix}path__lt": self.path[:-1] + "0",
+            }
         )
@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Scope
+from .tree import invalidate_scope_tree
+
+
+@receiver(post_save, sender=Scope)
+@receiver(post_delete, sender=Scope)
+def clear_scope_tree(sender, instance, **kwargs):
+    # after the commit, so the tree is not rebuilt before the paths are updated
+    transaction.on_commit(invalidate_scope_tree)
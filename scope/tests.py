@@ -1 +1,177 @@
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from problem.models import Problem
+from scope.curriculum import CurriculumError, import_curriculum, parse_curriculum
+from scope.models import Scope
+from scope.tree import get_scope_tree
+
+
+class ScopeTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.textbook = Scope(title="Physics", is_published=True)
+        cls.textbook.save()
+        cls.units = []
+        for order in (2, 1):
+            unit = Scope(
+                title=f"Unit {order}",
+                level=Scope.LevelChoices.UNIT,
+                parent=cls.textbook,
+                in_scope_order=order,
+                is_published=order == 1,
+            )
+            unit.save()
+            cls.units.append(unit)
+
+    def test_navigation_reads_no_queries(self):
+        get_scope_tree()
+        with self.assertNumQueries(0):
+            tree = get_scope_tree()
+            unit = tree.get_by_slug(self.units[0].slug)
+            self.assertEqual(
+                [node.title for node in tree.ancestors(unit.id)], ["Physics", "Unit 2"]
+            )
+            self.assertEqual(
+                [node.title for node in tree.children(self.textbook.id)], ["Unit 1"]
+            )
+            self.assertEqual(
+                [node.title for node in tree.children(self.textbook.id, False)],
+                ["Unit 1", "Unit 2"],
+            )
+
+    def test_rebuilt_when_a_scope_is_saved(self):
+        tree = get_scope_tree()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.units[0].title = "Renamed"
+            self.units[0].save()
+        self.assertIsNot(get_scope_tree(), tree)
+        self.assertEqual(get_scope_tree().get(self.units[0].id).title, "Renamed")
+
+    def test_bundle_revalidated_with_etag(self):
+        response = self.client.get("/scope/tree/")
+        bundle = response.json()
+        self.assertEqual(bundle["roots"], [self.textbook.id])
+        self.assertEqual(
+            bundle["scopes"][str(self.textbook.id)]["children"], [self.units[1].id]
+        )
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        response = self.client.get("/scope/tree/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get("/scope/0/tree/").status_code, 404)
+
+
+class ScopePathTests(TestCase):
+    def setUp(self):
+        self.textbook = Scope(title="Physics")
+        self.textbook.save()
+        self.unit = Scope(
+            title="Unit", level=Scope.LevelChoices.UNIT, parent=self.textbook
+        )
+        self.unit.save()
+        self.chapter = Scope(
+            title="Chapter", level=Scope.LevelChoices.CHAPTER, parent=self.unit
+        )
+        self.chapter.save()
+
+    def test_cycle_rejected_without_walking_parents(self):
+        self.textbook.parent = self.chapter
+        with self.assertNumQueries(0):
+            with self.assertRaises(ValidationError):
+                self.textbook.clean()
+
+    def test_reparent_rewrites_subtree_paths(self):
+        other = Scope(title="Chemistry")
+        other.save()
+        self.unit.parent = other
+        self.unit.save()
+        self.chapter.refresh_from_db()
+        self.assertEqual(
+            self.chapter.path, f"{other.id}/{self.unit.id}/{self.chapter.id}/"
+        )
+
+
+class ScopeSubtreeTests(TestCase):
+    def create_branch(self, textbook_id, title):
+        """creates a textbook with the given id down to a lesson with one
+        published problem, and returns the textbook, unit and problem"""
+        textbook = Scope(id=textbook_id, title=title)
+        textbook.save()
+        parent = textbook
+        for level in range(Scope.LevelChoices.UNIT, Scope.LevelChoices.LESSON + 1):
+            scope = Scope(title=f"{title} {level}", level=level, parent=parent)
+            scope.save()
+            parent = scope
+        problem = Problem.objects.create(scope=parent, body=title, is_published=True)
+        return textbook, textbook.children.get(), problem
+
+    def test_sibling_ids_sharing_a_prefix(self):
+        # "41/" is a prefix of "412/" as a string, but not as a path
+        physics, _, motion = self.create_branch(41, "Physics")
+        chemistry, _, atoms = self.create_branch(412, "Chemistry")
+        biology, _, cells = self.create_branch(4, "Biology")
+        Problem.objects.create(scope=motion.scope, body="Draft")
+
+        self.assertEqual(list(physics.problems), [motion])
+        self.assertEqual(list(chemistry.problems), [atoms])
+        self.assertEqual(list(biology.problems), [cells])
+        self.assertEqual(
+            list(motion.scope.problems), [motion], "the lesson matches itself"
+        )
+        # the textbook down to its lesson
+        self.assertEqual(Scope.objects.filter(physics.subtree_q()).count(), 4)
+
+    def test_reparented_subtree_moves_with_its_problems(self):
+        physics, unit, motion = self.create_branch(41, "Physics")
+        chemistry, _, atoms = self.create_branch(412, "Chemistry")
+
+        unit.parent = chemistry
+        unit.in_scope_order = 2
+        unit.save()
+        physics.refresh_from_db()
+        chemistry.refresh_from_db()
+        self.assertEqual(list(physics.problems), [])
+        self.assertEqual(set(chemistry.problems), {motion, atoms})
+        lesson = Scope.objects.get(pk=motion.scope_id)
+        self.assertTrue(lesson.path.startswith(f"{chemistry.id}/{unit.id}/"))
+        self.assertEqual(list(lesson.problems), [motion])
+
+
+class ImportCurriculumTests(TestCase):
+    curriculum = [
+        {
+            "title": "Physics",
+            "children": [
+                {"title": "Unit 1", "children": [{"title": "Motion"}]},
+                {"title": "Unit 2", "is_published": True},
+            ],
+        }
+    ]
+
+    def test_invalid_curriculum_reports_every_error(self):
+        with self.assertRaises(CurriculumError) as error:
+            parse_curriculum([{"title": "A"}, {"title": "A"}, {"caption": "B"}])
+        self.assertEqual(len(error.exception.errors), 2)
+
+    def test_import_and_update(self):
+        import_curriculum(parse_curriculum(self.curriculum))
+        motion = Scope.objects.get(title="Motion")
+        unit = motion.parent
+        self.assertEqual(motion.level, Scope.LevelChoices.CHAPTER)
+        self.assertEqual(motion.path, f"{unit.parent_id}/{unit.id}/{motion.id}/")
+        self.assertEqual(
+            list(unit.parent.children.values_list("title", "in_scope_order")),
+            [("Unit 1", 1), ("Unit 2", 2)],
+        )
+
+        curriculum = [
+            {
+                "title": "Physics",
+                "children": [{"title": "Unit 1", "is_published": True}],
+            }
+        ]
+        counts = import_curriculum(parse_curriculum(curriculum), update=True)
+        self.assertEqual(counts, {"created": 0, "updated": 1, "unchanged": 1})
+        unit.refresh_from_db()
+        self.assertTrue(unit.is_published)
@@ -0,0 +1,198 @@
+import json
+import time
+from collections import Counter
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Count
+from django.urls import reverse
+
+from problem.models import Problem
+from problem.pools import get_pools_version
+from scope.models import Scope
+
+TREE_VERSION_KEY = "scope_tree:version"
+BUNDLE_TIMEOUT = 60 * 60 * 24
+
+# process-local snapshot of the tree of the current version
+_local_tree = {"version": None, "tree": None}
+
+
+class Cover(NamedTuple):
+    name: str
+    url: str
+
+
+class ScopeNode(NamedTuple):
+    """Read-only copy of a scope, with the same attributes templates use"""
+
+    id: int
+    title: str
+    caption: str
+    cover: Cover | None
+    slug: str
+    in_scope_order: int
+    parent_id: int | None
+    level: int
+    is_published: bool
+    path: str
+
+    def __str__(self):
+        return f"{self.type}: {self.title}"
+
+    @property
+    def url(self):
+        return reverse("scope-details", kwargs={"slug": self.slug})
+
+    @property
+    def type(self):
+        return Scope.LevelChoices(self.level).label
+
+
+class ScopeTree:
+    """Immutable snapshot of the whole scope tree, the nodes by id and by slug,
+    and the ids of the children of every scope in order."""
+
+    def __init__(self, nodes, version=None):
+        self.version = version
+        self.nodes = {node.id: node for node in nodes}
+        self.slugs = {node.slug: node.id for node in nodes}
+        children = {None: []}
+        for node in nodes:
+            children.setdefault(node.id, [])
+        for node in sorted(nodes, key=lambda node: (node.in_scope_order, node.id)):
+            children.setdefault(node.parent_id, []).append(node.id)
+        self.children_ids = {scope_id: tuple(ids) for scope_id, ids in children.items()}
+
+    def get(self, scope_id):
+        return self.nodes.get(scope_id)
+
+    def get_by_slug(self, slug):
+        return self.nodes.get(self.slugs.get(slug))
+
+    def children(self, scope_id=None, published=True) -> list[ScopeNode]:
+        """returns the children of a scope in order, the textbooks for None"""
+        nodes = [self.nodes[child_id] for child_id in self.children_ids[scope_id]]
+        if published:
+            return [node for node in nodes if node.is_published]
+        return nodes
+
+    def ancestors(self, scope_id) -> list[ScopeNode]:
+        """returns the scope and its ancestors from the textbook down,
+        read from the scope path"""
+        return [self.nodes[int(i)] for i in self.nodes[scope_id].path.split("/")[:-1]]
+
+    def subtree(self, scope_id=None, published=True) -> list[ScopeNode]:
+        """returns the scope and all of its descendants, depth first,
+        or the whole tree for None"""
+        nodes = []
+        pending = (
+            [self.nodes[scope_id]]
+            if scope_id is not None
+            else self.children(None, published)[::-1]
+        )
+        while pending:
+            node = pending.pop()
+            nodes.append(node)
+            pending.extend(self.children(node.id, published)[::-1])
+        return nodes
+
+
+def _get_version():
+    """returns the current tree version, all workers share it through the cache"""
+    version = cache.get(TREE_VERSION_KEY)
+    if version is None:
+        cache.add(TREE_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(TREE_VERSION_KEY)
+    return version
+
+
+def invalidate_scope_tree():
+    """Makes every worker rebuild its tree, it should be called whenever scopes
+    change in a way that bypasses the Scope signals (e.g. queryset.update)"""
+    cache.set(TREE_VERSION_KEY, time.time_ns(), None)
+
+
+def _build_tree(version):
+    scopes = Scope.objects.order_by().values_list(
+        "id",
+        "title",
+        "caption",
+        "cover",
+        "slug",
+        "in_scope_order",
+        "parent_id",
+        "level",
+        "is_published",
+        "path",
+    )
+    nodes = [
+        ScopeNode(
+            scope_id,
+            title,
+            caption,
+            Cover(cover, default_storage.url(cover)) if cover else None,
+            *rest,
+        )
+        for scope_id, title, caption, cover, *rest in scopes
+    ]
+    return ScopeTree(nodes, version)
+
+
+def get_scope_tree() -> ScopeTree:
+    """returns the scope tree snapshot of the current version,
+    it is only read from the database when the version changed"""
+    version = _get_version()
+    if _local_tree["version"] != version:
+        _local_tree["tree"] = _build_tree(version)
+        _local_tree["version"] = version
+    return _local_tree["tree"]
+
+
+def _build_bundle(tree, scope_id):
+    nodes = tree.subtree(scope_id)
+    # published problems of every lesson, rolled up the scopes paths
+    lesson_counts = (
+        Problem.objects.filter(is_published=True)
+        .order_by()
+        .values_list("scope_id")
+        .annotate(count=Count("id"))
+    )
+    counts = Counter()
+    for lesson_id, count in lesson_counts:
+        lesson = tree.get(lesson_id)
+        if lesson:
+            for ancestor_id in lesson.path.split("/")[:-1]:
+                counts[int(ancestor_id)] += count
+
+    return {
+        "roots": [scope_id]
+        if scope_id is not None
+        else [node.id for node in tree.children()],
+        "scopes": {
+            node.id: {
+                "title": node.title,
+                "level": node.level,
+                "children": [child.id for child in tree.children(node.id)],
+                "problems": counts[node.id],
+            }
+            for node in nodes
+        },
+    }
+
+
+def get_scope_bundle(scope_id=None) -> tuple[str, str]:
+    """Returns the version and the JSON of the published subtree of a scope,
+    or of the whole published tree for None: the title, level, children ids
+    and published problems count of every scope.
+    The version changes with the scopes and the problems, and the JSON of each
+    version is built once and shared by all workers through the cache."""
+    tree = get_scope_tree()
+    version = f"{tree.version}-{get_pools_version()}"
+    key = f"scope_bundle:{version}:{scope_id}"
+    bundle = cache.get(key)
+    if bundle is None:
+        bundle = json.dumps(_build_bundle(tree, scope_id), separators=(",", ":"))
+        cache.set(key, bundle, BUNDLE_TIMEOUT)
+    return version, bundle
@@ -4,12 +4,15 @@ from problem.views import scope_problem_list
 from scope.views import (
     favorites,
     scope_browser,
+    scope_bundle_api,
     scope_list_api,
 )
 
 urlpatterns = [
     path("textbooks/", scope_browser, name="textbooks"),
     path("<int:id>/", scope_list_api, name="scope-api"),
+    path("tree/", scope_bundle_api, name="scope-tree-api"),
+    path("<int:id>/tree/", scope_bundle_api, name="scope-subtree-api"),
     path("favorites/", favorites, name="favorites"),
     path("<slug:slug>/", scope_browser, name="scope-details"),
     path("<slug:slug>/problems/", scope_problem_list, name="scope-problem-list"),
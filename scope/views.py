@@ -1,19 +1,12 @@
 from django.contrib.auth.decorators import login_required
-from django.db.models import Exists, OuterRef, Prefetch
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render
-from django.views.decorators.http import require_http_methods
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_http_methods
 
 from scope.models import Scope
-
-
-def _get_breadcrumbs(scope) -> list[Scope]:
-    """Builds the breadcrumbs of the scope"""
-    breadcrumbs = []
-    while scope:
-        breadcrumbs.insert(0, scope)
-        scope = scope.parent
-    return breadcrumbs
+from scope.tree import get_scope_bundle, get_scope_tree
+from tracker.utils import get_user_mastery
 
 
 @login_required(login_url="login")
@@ -24,36 +17,41 @@ def scope_browser(request, slug=None):
     If the slug parameter is given, it renders the page for that scope.
     Otherwise, it renders the page for the textbooks.
 
-    The page shows the given scope and its children, and also includes
-    the breadcrumbs to the given scope.
+    The page shows the given scope and its published children, and also
+    includes the breadcrumbs to the given scope, all read from the scope tree.
 
-    The children are annotated with a boolean field "is_fav" indicating
-    whether the user has favorited the scope.
+    Every child card says whether the user has favorited the scope,
+    and the user accuracy in it.
     """
-    favorites_subquery = request.user.profile.favorites.filter(id=OuterRef("id"))
-
+    tree = get_scope_tree()
     if slug:
-        scope = get_object_or_404(
-            Scope.objects.prefetch_related(
-                Prefetch("children", queryset=Scope.objects.filter(is_published=True))
-            ),
-            slug=slug,
-        )
-        children = scope.children.annotate(is_fav=Exists(favorites_subquery))
-        breadcrumbs = _get_breadcrumbs(scope)
+        scope = tree.get_by_slug(slug)
+        if scope is None:
+            raise Http404("No scope matches the given query.")
+        children = tree.children(scope.id)
+        breadcrumbs = tree.ancestors(scope.id)
     else:
         scope = None
-        children = Scope.objects.filter(
-            parent__isnull=True, is_published=True
-        ).annotate(is_fav=Exists(favorites_subquery))
+        children = tree.children()
         breadcrumbs = []
 
+    favorite_ids = set(request.user.profile.favorites.values_list("id", flat=True))
+    mastery = get_user_mastery(request.user)
+    cards = [
+        {
+            "scope": child,
+            "is_fav": child.id in favorite_ids,
+            "mastery": mastery.get(child.id),
+        }
+        for child in children
+    ]
+
     # Get the children list title
     # If there are children, use the their level's name
     # Otherwise, use next level name of the current scope
     list_title = "Textbooks"
-    if children.exists():
-        child_level = children.first().level
+    if children:
+        child_level = children[0].level
         list_title = Scope.LevelChoices(child_level).label + "s"
     elif scope:
         next_level = scope.level + 1
@@ -65,7 +63,7 @@ def scope_browser(request, slug=None):
         context={
             "list_title": list_title,
             "parent": scope,
-            "scopes": children,
+            "cards": cards,
             "breadcrumbs": breadcrumbs,
         },
     )
@@ -73,14 +71,37 @@ def scope_browser(request, slug=None):
 
 @require_http_methods(["GET"])
 def scope_list_api(request, id):
-    scope = get_object_or_404(
-        Scope.objects.prefetch_related(
-            Prefetch("children", queryset=Scope.objects.filter(is_published=True))
-        ),
-        id=id,
-    )
-    children = scope.children.values("id", "title")
-    return JsonResponse(list(children), safe=False)
+    tree = get_scope_tree()
+    if tree.get(id) is None:
+        raise Http404("No scope matches the given query.")
+    children = [{"id": child.id, "title": child.title} for child in tree.children(id)]
+    return JsonResponse(children, safe=False)
+
+
+def _scope_bundle_etag(request, id=None):
+    if id is not None and get_scope_tree().get(id) is None:
+        return None
+    version, _ = get_scope_bundle(id)
+    return f"{version}-{id}"
+
+
+@require_http_methods(["GET"])
+@condition(etag_func=_scope_bundle_etag)
+def scope_bundle_api(request, id=None):
+    """Returns the whole published subtree of a scope, or the whole published tree,
+    in one JSON payload (see get_scope_bundle), so clients can navigate it locally.
+    Requests for the current version (?v=) can be cached for good,
+    the others are revalidated with the ETag."""
+    if id is not None and get_scope_tree().get(id) is None:
+        raise Http404("No scope matches the given query.")
+    version, bundle = get_scope_bundle(id)
+    response = HttpResponse(bundle, content_type="application/json")
+    if request.GET.get("v") == version:
+        patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365)
+        patch_cache_control(response, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
 
 
 @login_required(login_url="login")
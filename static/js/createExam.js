@@ -4,7 +4,7 @@ let selectedScopeType = "textbook";
 const scopeTypes = ["textbook", "unit", "chapter", "lesson"];
 const scopeContainers = document.querySelectorAll(".scope");
 const scopeRadioButtons = document.querySelectorAll("input[name='scope_type']");
-const scopeSelects = document.querySelectorAll("select");
+const scopeSelects = document.querySelectorAll(".scope select");
 const examForm = document.querySelector(".custom-exam-form");
 const submitButton = document.querySelector("button[type='submit']");
 const examTitleInput = document.getElementById("exam-title");
@@ -23,6 +23,31 @@ const rangeValueDisplay = document.getElementById("range-value");
 // Cache for scope data
 const scopeDataCache = new Map();
 const scopeHierarchy = new Map(); // Map to track parent-child relationships
+let scopeBundle = null; // The whole published scope tree, loaded once
+
+// Load the scope tree bundle once, all the levels are then read from it
+function loadScopeBundle() {
+    if (!scopeBundle) {
+        scopeBundle = fetch(examForm.dataset.bundleUrl).then(response => {
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+            return response.json();
+        });
+        // Allow retrying after a failure
+        scopeBundle.catch(() => { scopeBundle = null; });
+    }
+    return scopeBundle;
+}
+
+async function getScopeChildren(scopeId) {
+    const bundle = await loadScopeBundle();
+    const scope = bundle.scopes[scopeId];
+    if (!scope) throw new Error(`Unknown scope ${scopeId}`);
+    return scope.children.map(childId => ({
+        id: childId,
+        title: bundle.scopes[childId].title,
+        problems: bundle.scopes[childId].problems,
+    }));
+}
 
 // Initialize
 document.addEventListener("DOMContentLoaded", () => {
@@ -272,10 +297,7 @@ async function loadScopeChildren(scopeItem) {
     childrenContainer.innerHTML = '<div class="loading-children"><i class="fas fa-spinner fa-spin"></i> Loading...</div>';
     
     try {
-        const response = await fetch(`/scope/${scopeId}/`);
-        if (!response.ok) throw new Error("Failed to load children");
-        
-        const children = await response.json();
+        const children = await getScopeChildren(scopeId);
         childrenContainer.innerHTML = "";
         childrenContainer.dataset.loaded = "true";
         
@@ -621,13 +643,7 @@ async function fillScopeSelect(containerIndex, parentId) {
     scopeSelect.disabled = true;
 
     try {
-        const response = await fetch(`/scope/${parentId}/`);
-        
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        
-        const data = await response.json();
+        const data = await getScopeChildren(parentId);
         scopeDataCache.set(cacheKey, data);
         populateSelect(scopeSelect, data);
         
@@ -659,7 +675,7 @@ function populateSelect(selectElement, data) {
     data.forEach(item => {
         const option = document.createElement("option");
         option.value = item.id;
-        option.textContent = item.title;
+        option.textContent = `${item.title} (${item.problems})`;
         selectElement.appendChild(option);
     });
 }
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
-from .models import ExamTracker
+from .models import ExamTracker, UserStats
 
 admin.site.register(ExamTracker)
+admin.site.register(UserStats)
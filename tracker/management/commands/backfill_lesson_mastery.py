@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from exam.service import rebuild_lesson_mastery
+
+
+class Command(BaseCommand):
+    help = "Build the users lessons mastery from their completed submissions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of lessons mastery written per query",
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_lesson_mastery(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Built {total} lessons mastery counters"))
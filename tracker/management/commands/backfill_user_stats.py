@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from exam.service import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = "Build the users stats rollups from their completed submissions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users stats written per query",
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_user_stats(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Built the stats of {total} users"))
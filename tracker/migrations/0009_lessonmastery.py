@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scope', '0012_scope_path'),
+        ('tracker', '0008_userstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonMastery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempted', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('scope', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scope.scope')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_mastery', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Lesson Mastery',
+                'verbose_name_plural': 'Lessons Mastery',
+                'db_table': 'lesson_mastery',
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope'), name='unique_user_lesson_mastery')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_lessonmastery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='seen_problems',
+            field=models.BinaryField(default=b''),
+        ),
+    ]
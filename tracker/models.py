@@ -6,6 +6,9 @@ from django.db import models
 from django.utils import timezone
 
 from exam.models import Exam
+from scope.models import Scope
+
+from .bitset import Bitset
 
 
 class ExamTracker(models.Model):
@@ -69,3 +72,74 @@ class ExamTracker(models.Model):
             created_by=self.user, created_at__gte=self.week_start
         ).count()
         self.save()
+
+
+class UserStats(models.Model):
+    """This model keeps a rollup of the completed submissions of a user.
+    It is updated when a submission is graded, so the dashboard reads it in one lookup"""
+
+    LAST_SCORES_LENGTH = 10
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="stats")
+    submissions_count = models.PositiveIntegerField(default=0)
+    percentage_sum = models.FloatField(default=0.0)
+    # the average before the latest submission, it is used for the trend
+    previous_average = models.FloatField(blank=True, null=True)
+    # percentages of the latest submissions, the most recent first
+    last_scores = models.JSONField(default=list)
+    # bitset of the ids of the problems the user answered (see tracker.bitset)
+    seen_problems = models.BinaryField(default=b"", editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "user_stats"
+        verbose_name = "User Stats"
+        verbose_name_plural = "User Stats"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.submissions_count} submissions"
+
+    @property
+    def average(self):
+        if not self.submissions_count:
+            return None
+        return self.percentage_sum / self.submissions_count
+
+    def add_submission(self, percentage):
+        """Adds the percentage of a newly completed submission to the rollup"""
+        self.previous_average = self.average
+        self.submissions_count += 1
+        self.percentage_sum += percentage
+        self.last_scores = [percentage, *self.last_scores][: self.LAST_SCORES_LENGTH]
+
+    def add_seen_problems(self, problem_ids):
+        """Adds the answered problems of a newly completed submission to the seen ones"""
+        seen = Bitset(self.seen_problems)
+        seen.update(problem_ids)
+        self.seen_problems = bytes(seen)
+
+
+class LessonMastery(models.Model):
+    """This model counts the answers of a user in each lesson.
+    It is updated in batch when a submission is graded,
+    and rolled up to chapters, units and textbooks through the scopes paths"""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="lesson_mastery"
+    )
+    scope = models.ForeignKey(Scope, on_delete=models.CASCADE, related_name="+")
+    attempted = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "lesson_mastery"
+        verbose_name = "Lesson Mastery"
+        verbose_name_plural = "Lessons Mastery"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "scope"], name="unique_user_lesson_mastery"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.scope.title} - {self.correct} / {self.attempted}"
@@ -1,2 +1,139 @@
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from exam.models import Submission
+from exam.service import rebuild_lesson_mastery
+from exam.tests import GradedExamTestCase
+from tracker.bitset import Bitset
+from tracker.models import LessonMastery, UserStats
+from tracker.utils import get_user_mastery
+
+
+class UserStatsTests(SimpleTestCase):
+    def test_add_submission(self):
+        stats = UserStats()
+        self.assertIsNone(stats.average)
+        for percentage in [50, 100, 30]:
+            stats.add_submission(percentage)
+        self.assertEqual(stats.submissions_count, 3)
+        self.assertEqual(stats.average, 60)
+        self.assertEqual(stats.previous_average, 75)
+        self.assertEqual(stats.last_scores, [30, 100, 50])
+
+    def test_last_scores_are_trimmed(self):
+        stats = UserStats()
+        for percentage in range(UserStats.LAST_SCORES_LENGTH + 5):
+            stats.add_submission(percentage)
+        self.assertEqual(len(stats.last_scores), UserStats.LAST_SCORES_LENGTH)
+        self.assertEqual(stats.last_scores[0], UserStats.LAST_SCORES_LENGTH + 4)
+
+    def test_add_seen_problems(self):
+        stats = UserStats()
+        stats.add_seen_problems([3, 10])
+        stats.add_seen_problems([10, 64])
+        seen = Bitset(stats.seen_problems)
+        self.assertEqual([value for value in range(100) if value in seen], [3, 10, 64])
+
+
+class UserStatsRollupTests(GradedExamTestCase):
+    def user_stats(self):
+        return {
+            stats.user_id: (
+                stats.submissions_count,
+                stats.percentage_sum,
+                stats.previous_average,
+                stats.last_scores,
+                bytes(stats.seen_problems),
+            )
+            for stats in UserStats.objects.all()
+        }
+
+    def test_grading_updates_the_stats(self):
+        self.submit(self.users[0], [0, 1, 0, None])
+        self.submit(self.users[0], [0, 0, 0, 0])
+
+        stats = UserStats.objects.get(user=self.users[0])
+        self.assertEqual(stats.submissions_count, 2)
+        self.assertEqual(stats.average, 75)
+        self.assertEqual(stats.previous_average, 50)
+        self.assertEqual(stats.last_scores, [100, 50])
+        seen = Bitset(stats.seen_problems)
+        self.assertTrue(all(problem.id in seen for problem in self.problems))
+
+    def test_backfill_matches_the_stats(self):
+        self.submit(self.users[0], [0, 1, 0, None])
+        self.submit(self.users[0], [0, 0, 0, 0])
+        self.submit(self.users[1], [1, None, None, None])
+        # an anonymous submission is not counted
+        Submission.objects.create(
+            exam=self.exam, status=Submission.Status.COMPLETED, percentage=100
+        )
+        user_stats = self.user_stats()
+        UserStats.objects.all().delete()
+
+        call_command("backfill_user_stats", batch_size=1, stdout=StringIO())
+        self.assertEqual(self.user_stats(), user_stats)
+
+
+class LessonMasteryTests(GradedExamTestCase):
+    def mastery(self):
+        return {
+            (user_id, scope_id): (attempted, correct)
+            for user_id, scope_id, attempted, correct in (
+                LessonMastery.objects.values_list(
+                    "user_id", "scope_id", "attempted", "correct"
+                )
+            )
+        }
+
+    def test_grading_updates_the_mastery(self):
+        self.submit(self.users[0], [0, 1, 0, None])
+        self.submit(self.users[0], [0, 0, 0, 0])
+        self.submit(self.users[1], [1, None, None, None])
+
+        vectors, forces = (lesson.id for lesson in self.lessons)
+        self.assertEqual(
+            self.mastery(),
+            {
+                (self.users[0].id, vectors): (4, 3),
+                (self.users[0].id, forces): (3, 3),
+                (self.users[1].id, vectors): (1, 0),
+            },
+        )
+        # rolled up to the textbook of both lessons
+        self.assertEqual(
+            get_user_mastery(self.users[0]),
+            {vectors: 75, forces: 100, self.lessons[0].parent_id: 6 / 7 * 100},
+        )
+
+    def test_backfill_matches_the_mastery(self):
+        self.submit(self.users[0], [0, 1, 0, None])
+        self.submit(self.users[0], [0, 0, 0, 0])
+        self.submit(self.users[1], [1, None, None, None])
+        Submission.objects.create(
+            exam=self.exam, status=Submission.Status.COMPLETED, percentage=100
+        )
+        mastery = self.mastery()
+        LessonMastery.objects.update(attempted=0, correct=0)
+
+        call_command("backfill_lesson_mastery", batch_size=1, stdout=StringIO())
+        self.assertEqual(self.mastery(), mastery)
+
+    def test_rebuild_of_some_users_and_lessons(self):
+        self.submit(self.users[0], [0, 0, 0, 0])
+        self.submit(self.users[1], [0, 0, 0, 0])
+        LessonMastery.objects.update(attempted=9, correct=9)
+
+        vectors, forces = (lesson.id for lesson in self.lessons)
+        self.assertEqual(rebuild_lesson_mastery([self.users[0].id], [vectors]), 1)
+        self.assertEqual(
+            self.mastery(),
+            {
+                (self.users[0].id, vectors): (2, 2),
+                (self.users[0].id, forces): (9, 9),
+                (self.users[1].id, vectors): (9, 9),
+                (self.users[1].id, forces): (9, 9),
+            },
+        )
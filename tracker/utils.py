@@ -0,0 +1,33 @@
+from collections import defaultdict
+
+from .bitset import Bitset
+from .models import LessonMastery, UserStats
+
+
+def get_user_mastery(user) -> dict[int, float]:
+    """returns a map of scope id to the percentage of correct answers of the user
+    in it, for every lesson the user answered and all of their ancestors.
+    It reads the lessons counters in one query and rolls them up the scopes paths."""
+    counts = defaultdict(lambda: [0, 0])
+    lessons = LessonMastery.objects.filter(user=user).values_list(
+        "scope__path", "attempted", "correct"
+    )
+    for path, attempted, correct in lessons:
+        for scope_id in path.split("/")[:-1]:
+            counts[int(scope_id)][0] += attempted
+            counts[int(scope_id)][1] += correct
+    return {
+        scope_id: correct / attempted * 100
+        for scope_id, (attempted, correct) in counts.items()
+        if attempted
+    }
+
+
+def get_seen_problems(user) -> Bitset:
+    """returns the bitset of the ids of the problems the user has already answered"""
+    seen = (
+        UserStats.objects.filter(user=user)
+        .values_list("seen_problems", flat=True)
+        .first()
+    )
+    return Bitset(seen)